@@ -0,0 +1,486 @@
+"""
+Benchmarks for the search module.
+
+Run all of the micro-benchmarks with
+    python benchmarks.py
+or a single one with e.g.
+    python benchmarks.py country_map_loading
+
+The search suite runs every searcher on a fixed set of seeded instances and
+saves the results to a JSON file named after the current git commit:
+    python benchmarks.py suite [results.json]
+Two such files, e.g. from two commits, are compared with
+    python benchmarks.py compare old.json new.json
+"""
+
+import datetime
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from search import *
+
+
+def timed(fn, *args, **kwargs):
+    """Call fn and return (result, elapsed seconds)."""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def best_time(fn, *args, repeat=5):
+    """Best elapsed seconds of repeat calls of fn(*args). As in timeit, the
+    garbage collector is off while timing so its pauses don't add noise."""
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            best = min(best, timed(fn, *args)[1])
+        finally:
+            gc.enable()
+    return best
+
+
+# ______________________________________________________________________________
+# Country maps
+
+
+def bench_country_map_loading(repeat=20):
+    """Cold (read from map_data/) versus warm (cached) load time of every
+    country map, in milliseconds."""
+    table = []
+    for country in COUNTRIES:
+        cold = warm = 0
+        for _ in range(repeat):
+            load_country_map.cache_clear()
+            cold += timed(load_country_map, country)[1]
+            warm += timed(load_country_map, country)[1]
+        table.append([country, 1000 * cold / repeat, 1000 * warm / repeat])
+    print_table(table, ['Country', 'cold ms', 'warm ms'], numfmt='{:.4f}')
+
+
+# ______________________________________________________________________________
+# Random graphs
+
+
+def bench_random_graph(sizes=(1000, 10000, 100000), queries=10000, seed=0):
+    """Time to build a RandomGraph of each size, and nearest_node queries per
+    second on it."""
+    table = []
+    for n in sizes:
+        random.seed(seed)
+        side = int(30 * math.sqrt(n))
+        g, build = timed(RandomGraph, list(range(n)), width=side, height=side)
+        points = [(random.uniform(0, side), random.uniform(0, side)) for _ in range(queries)]
+        g.nearest_node(points[0])
+        _, elapsed = timed(lambda: [g.nearest_node(p) for p in points])
+        table.append([n, build, queries / elapsed])
+    print_table(table, ['Nodes', 'build s', 'nearest/s'], numfmt='{:.6g}')
+
+
+# ______________________________________________________________________________
+# Instrumentation overhead
+
+
+def bench_instrumentation_overhead(repeat=9):
+    """Time of a plain problem versus InstrumentedProblem and instrument() on
+    searches whose cost is mostly calls to the problem's methods. Overhead is
+    relative to the plain problem, best of repeat interleaved runs. The
+    wrappers are created inside the timed call, so their setup counts too."""
+    cases = [('depth_limited 8-puzzle', 1, lambda p: depth_limited_search(p, 12),
+              EightPuzzle((1, 2, 3, 4, 5, 6, 0, 7, 8), goal=(8, 7, 6, 5, 4, 3, 2, 1, 0))),
+             ('depth_first_tree 10-queens', 100, depth_first_tree_search, NQueensProblem(10)),
+             ('uniform_cost_many Russia', 100, lambda p: uniform_cost_search_many(p, p.graph.nodes()),
+              country_maps.problem('Russia'))]
+    wrappers = [lambda p: p, InstrumentedProblem, instrument]
+    table = []
+    for case, number, searcher, problem in cases:
+        def run(wrap):
+            for _ in range(number):
+                searcher(wrap(problem))
+        best = [min(times) for times in zip(*[[best_time(run, wrap, repeat=1) for wrap in wrappers]
+                                               for _ in range(repeat)])]
+        plain, delegating, inline = best
+        table.append([case, plain, delegating, inline,
+                      '{:+.1f}%'.format(100 * (delegating / plain - 1)),
+                      '{:+.1f}%'.format(100 * (inline / plain - 1))])
+    print_table(table, ['Search', 'plain s', 'Instrumented s', 'instrument() s',
+                        'Instrumented', 'instrument()'], numfmt='{:.4f}')
+
+
+# ______________________________________________________________________________
+# Checkpoints
+
+
+def bench_checkpoint(interval=0.1):
+    """Cost of checkpointing long searches: the search time without and
+    with a SearchCheckpoint saving every interval seconds, the number of
+    saves, the mean time of one save, the size of the last checkpoint file
+    and the time to load it back."""
+    cases = [('BFS 8-puzzle', breadth_first_graph_search, scrambled_eight_puzzle(16, 16)),
+             ('UCS 8-puzzle', uniform_cost_search, scrambled_eight_puzzle(12, 12)),
+             ('A* 8-puzzle', astar_search, scrambled_eight_puzzle(24, 24))]
+    table = []
+    with tempfile.TemporaryDirectory() as directory:
+        for case, searcher, problem in cases:
+            filename = os.path.join(directory, 'checkpoint.npz')
+            plain = timed(searcher, problem)[1]
+            checkpoint = SearchCheckpoint(filename, interval)
+            with_checkpoints = timed(searcher, problem, checkpoint=checkpoint)[1]
+            size = load = 0
+            if checkpoint.saves:
+                size = os.path.getsize(filename)
+                load = timed(checkpoint.load)[1]
+                os.remove(filename)
+            table.append([case, plain, with_checkpoints, '{:+.1f}%'.format(100 * (with_checkpoints / plain - 1)),
+                          checkpoint.saves, 1000 * checkpoint.save_time / max(checkpoint.saves, 1),
+                          size / 1024, 1000 * load])
+    print_table(table, ['Search', 'plain s', 'checkpointed s', 'overhead', 'saves', 'ms/save', 'KiB',
+                        'load ms'], numfmt='{:.4g}')
+
+
+# ______________________________________________________________________________
+# Parallel breadth-first search
+
+
+def bench_parallel_bfs(workers=(1, 2, 4, 8)):
+    """Time of parallel_breadth_first_search over the whole 8-puzzle state
+    space (the goal is unreachable, so all 181440 states are visited) with
+    each number of worker processes, and the speedup over one worker."""
+    problem = EightPuzzle((1, 2, 3, 4, 5, 6, 7, 8, 0), goal=(2, 1, 3, 4, 5, 6, 7, 8, 0))
+    table = []
+    for n in workers:
+        elapsed = timed(parallel_breadth_first_search, problem, n)[1]
+        table.append([n, elapsed, table[0][1] / elapsed if table else 1.0])
+    print('CPUs:', os.cpu_count())
+    print_table(table, ['Workers', 'seconds', 'speedup'], numfmt='{:.4g}')
+
+
+# ______________________________________________________________________________
+# SMA*
+
+
+def bench_sma_star(max_nodes=50, timeout=5.0):
+    """sma_star_search with room for max_nodes nodes against astar_search on
+    every country map: with the map's straight-line h SMA* must find A*'s
+    cost wherever that is optimal (the h of some maps isn't admissible), and
+    with h = 0 it must find uniform_cost_search's cost everywhere. Each SMA*
+    run gets timeout seconds, so a search that loops fails instead of
+    hanging."""
+    table = []
+    for country in COUNTRIES:
+        problem = country_maps.problem(country)
+        optimal = uniform_cost_search(problem).path_cost
+        astar, astar_time = timed(astar_search, problem)
+        row = [country, optimal, astar.path_cost, astar_time]
+        for h in (None, lambda node: 0):
+            node, elapsed = timed(sma_star_search, problem, max_nodes, h, budget=SearchBudget(timeout=timeout))
+            assert node, '{}: SMA* returned {}'.format(country, node)
+            if h is None and astar.path_cost == optimal:
+                assert node.path_cost == astar.path_cost, '{}: SMA* cost {}'.format(country, node.path_cost)
+            if h is not None:
+                assert node.path_cost == optimal, '{}: SMA* cost {} with h = 0'.format(country, node.path_cost)
+            row += [node.path_cost, elapsed]
+        table.append(row)
+    print_table(table, ['Country', 'optimal', 'A*', 'A* s', 'SMA*', 'SMA* s', 'SMA* h=0', 'SMA* h=0 s'],
+                numfmt='{:.4g}')
+
+
+# ______________________________________________________________________________
+# Hash Distributed A*
+
+
+def bench_hda_star(workers=(1, 2, 4, 8), moves=(20, 24, 28)):
+    """Speedup of hda_star_search with each number of worker processes over
+    serial astar_search, on scrambled 8-puzzles and a 10000 node random
+    graph. Both must find the same optimal cost."""
+    random.seed(0)
+    graph = RandomGraph(list(range(10000)), width=3000, height=3000)
+    reached = uniform_cost_search_many(GraphProblem(0, None, graph), graph.nodes())
+    far = max((node for node in reached.values() if node), key=lambda node: node.path_cost).state
+    cases = [('8-puzzle {} moves'.format(m), scrambled_eight_puzzle(m, m)) for m in moves]
+    cases.append(('random graph', GraphProblem(0, far, graph)))
+    table = []
+    for case, problem in cases:
+        serial, serial_time = timed(astar_search, problem)
+        row = [case, serial_time]
+        for n in workers:
+            node, elapsed = timed(hda_star_search, problem, workers=n)
+            assert node.path_cost == serial.path_cost
+            row.append(serial_time / elapsed)
+        table.append(row)
+    print('CPUs:', os.cpu_count(), ' HDA* speedup over A*:')
+    print_table(table, ['Problem', 'A* s'] + ['{} workers'.format(n) for n in workers], numfmt='{:.4g}')
+
+
+# ______________________________________________________________________________
+# Local search
+
+
+def bench_hill_climbing_restarts(size=1000, restarts=(100, 1000, 10000), seed=0):
+    """Restarts per second of hill_climbing_restarts versus calling
+    hill_climbing once per start, on a random size x size PeakFindingProblem
+    grid with 8 directions."""
+    rng = np.random.default_rng(seed)
+    grid = rng.integers(0, 100, (size, size)).tolist()
+    problem = PeakFindingProblem((0, 0), grid, directions8)
+    table = []
+    for n in restarts:
+        (_, runs), batched = timed(hill_climbing_restarts, problem, n, seed=seed)
+        sample = runs['start'][:100]
+        _, loop = timed(lambda: [hill_climbing(PeakFindingProblem(tuple(int(i) for i in start), grid, directions8))
+                                 for start in sample])
+        table.append([n, n / batched, len(sample) / loop, (n / batched) / (len(sample) / loop)])
+    print_table(table, ['Restarts', 'batched/s', 'hill_climbing/s', 'speedup'], numfmt='{:.4g}')
+
+
+# ______________________________________________________________________________
+# Genetic algorithms
+
+
+def nqueens_fitness_python(q):
+    """nqueens_fitness of a single individual, in plain Python, as a
+    fitness_fn for genetic_algorithm."""
+    n = len(q)
+    return sum(q[i] != q[j] and abs(q[i] - q[j]) != j - i for i in range(n) for j in range(i + 1, n))
+
+
+def bench_genetic_algorithm(n=8, pop_number=100, ngen=200, seed=0):
+    """Individuals per second bred and evaluated on N-Queens by
+    genetic_algorithm (lists, Python fitness), genetic_algorithm_array with
+    the same Python fitness on each row, and genetic_algorithm_array with
+    the vectorized nqueens_fitness. No f_thres, so every run does ngen
+    generations."""
+    random.seed(seed)
+    population = init_population(pop_number, list(range(n)), n)
+    runs = [('genetic_algorithm', lambda: genetic_algorithm(population, nqueens_fitness_python,
+                                                            list(range(n)), None, ngen)),
+            ('array, Python fitness', lambda: genetic_algorithm_array(population, nqueens_fitness_python,
+                                                                      list(range(n)), None, ngen, seed=seed)),
+            ('array, nqueens_fitness', lambda: genetic_algorithm_array(population, nqueens_fitness,
+                                                                       list(range(n)), None, ngen,
+                                                                       vectorized=True, seed=seed))]
+    table = []
+    for name, run in runs:
+        best, elapsed = timed(run)
+        rate = pop_number * ngen / elapsed
+        table.append([name, rate, rate / table[0][1] if table else 1.0, nqueens_fitness_python(best)])
+    print_table(table, ['GA', 'individuals/s', 'speedup', 'best fitness'], numfmt='{:.4g}')
+
+
+# ______________________________________________________________________________
+# Island genetic algorithm
+
+
+def bench_island_genetic_algorithm(islands=4, pop_number=50, n=12, ngen=300, boggle_ngen=30, seed=0):
+    """genetic_algorithm on one population of islands * pop_number
+    individuals against island_genetic_algorithm on islands populations of
+    pop_number, on N-Queens (stopping at a solution) and on Boggle boards
+    (boggle_ngen generations, best word count). The Boggle rows need the
+    aima-data wordlist and are skipped without it."""
+    table = []
+    random.seed(seed)
+    populations = [init_population(pop_number, list(range(n)), n) for _ in range(islands)]
+    solved = n * (n - 1) // 2
+    runs = [('genetic_algorithm', lambda: genetic_algorithm(sum(populations, []), nqueens_fitness_python,
+                                                            list(range(n)), solved, ngen)),
+            ('island_genetic_algorithm', lambda: island_genetic_algorithm(populations, nqueens_fitness_python,
+                                                                          list(range(n)), solved, ngen,
+                                                                          seed=seed))]
+    for name, run in runs:
+        best, elapsed = timed(run)
+        table.append(['{}-queens'.format(n), name, elapsed, nqueens_fitness_python(best)])
+    try:
+        BoggleFinder()
+    except FileNotFoundError as e:
+        print('Skipping Boggle:', e)
+    else:
+        random.seed(seed)
+        populations = [init_population(pop_number, list(ALPHABET), 16) for _ in range(islands)]
+        runs = [('genetic_algorithm', lambda: genetic_algorithm(sum(populations, []), boggle_fitness,
+                                                                list(ALPHABET), None, boggle_ngen)),
+                ('island_genetic_algorithm', lambda: island_genetic_algorithm(populations, boggle_fitness,
+                                                                              list(ALPHABET), None, boggle_ngen,
+                                                                              seed=seed))]
+        for name, run in runs:
+            best, elapsed = timed(run)
+            table.append(['Boggle', name, elapsed, boggle_fitness(best)])
+    print_table(table, ['Problem', 'GA', 'seconds', 'best fitness'], numfmt='{:.4g}')
+
+
+# ______________________________________________________________________________
+# Boggle
+
+
+def bench_boggle(sizes=(4, 5, 6), boards=200, seed=0):
+    """Boards per second that BoggleFinder.set_board finds all the words of,
+    on boyan_best and on random boards of each size. Needs the aima-data
+    wordlist; skipped without it."""
+    try:
+        finder = BoggleFinder()
+    except FileNotFoundError as e:
+        print('Skipping:', e)
+        return
+    random.seed(seed)
+    cases = [('boyan_best', [boyan_best] * boards)]
+    cases += [('random {0}x{0}'.format(n), [random_boggle(n) for _ in range(boards)]) for n in sizes]
+    table = []
+    for name, case in cases:
+        words, elapsed = timed(lambda: sum(len(finder.set_board(board)) for board in case))
+        table.append([name, len(case) / elapsed, words / len(case)])
+    print_table(table, ['Boards', 'boards/s', 'words/board'], numfmt='{:.4g}')
+
+
+# ______________________________________________________________________________
+# Search suite
+
+
+def greedy_search(problem):
+    """Greedy best-first search, f(n) = h(n)."""
+    return greedy_best_first_graph_search(problem, problem.h)
+
+
+SUITE_SEARCHERS = [('BFS', breadth_first_graph_search),
+                   ('DFS', depth_first_graph_search),
+                   ('IDS', iterative_deepening_search),
+                   ('UCS', uniform_cost_search),
+                   ('greedy', greedy_search),
+                   ('A*', astar_search),
+                   ('RBFS', recursive_best_first_search),
+                   ('bidirectional', bidirectional_search)]
+
+
+def scrambled_eight_puzzle(moves, seed):
+    """An EightPuzzle whose initial state is a seeded random walk of the given
+    number of moves away from the goal (never undoing the previous move), so
+    its optimal solution is at most that long."""
+    rng = random.Random(seed)
+    puzzle = EightPuzzle(EightPuzzle((0,) * 9).goal)
+    opposite = {'UP': 'DOWN', 'DOWN': 'UP', 'LEFT': 'RIGHT', 'RIGHT': 'LEFT'}
+    state, last = puzzle.goal, None
+    for _ in range(moves):
+        action = rng.choice([a for a in puzzle.actions(state) if a != opposite.get(last)])
+        state, last = puzzle.result(state, action), action
+    return EightPuzzle(state)
+
+
+def suite_instances(puzzle_moves=(4, 8, 12, 16, 20, 24), queens=range(4, 31),
+                    graph_sizes=(100, 1000, 10000), seed=0):
+    """Return the suite's problems as a list of (family, instance, problem).
+    The same arguments always give the same problems."""
+    instances = [('8-puzzle', '{} moves'.format(moves), scrambled_eight_puzzle(moves, seed + moves))
+                 for moves in puzzle_moves]
+    instances += [('n-queens', 'N={}'.format(n), NQueensProblem(n)) for n in queens]
+    instances += [('country', country, country_maps.problem(country)) for country in COUNTRIES]
+    for size in graph_sizes:
+        random.seed(seed + size)
+        side = int(30 * math.sqrt(size))
+        graph = RandomGraph(list(range(size)), width=side, height=side)
+        start, goal = random.sample(range(size), 2)
+        instances.append(('random graph', '{} nodes'.format(size), GraphProblem(start, goal, graph)))
+    return instances
+
+
+def git_commit():
+    """The current git commit, or None outside of a git checkout."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_suite(filename=None, timeout=5.0, memory_limit=2 ** 31, max_workers=1, instances=None):
+    """Run every searcher of SUITE_SEARCHERS on every suite instance and save
+    time, node counts and peak memory to filename (by default
+    suite_<commit>.json). Each run gets timeout seconds and memory_limit
+    bytes (see search_limits). Time and counters come from a plain
+    instrument() run; peak memory from a second, tracemalloc run, since
+    tracing slows the search down. With the default max_workers=1 the runs
+    don't compete for the CPU, which keeps the times comparable."""
+    commit = git_commit()
+    filename = filename or 'suite_{}.json'.format(commit or 'nocommit')
+    instances = instances if instances is not None else suite_instances()
+    cells = [(family, instance, searcher_name, searcher, problem)
+             for family, instance, problem in instances
+             for searcher_name, searcher in SUITE_SEARCHERS
+             if problem.goal is not None or searcher is not bidirectional_search]
+    records = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(run_instrumented, searcher, problem, timeout, memory_limit,
+                                   False, instrument)
+                   for _, _, _, searcher, problem in cells]
+        for (family, instance, searcher_name, searcher, problem), future in zip(cells, futures):
+            stats = future.result()
+            if stats['error'] is None:
+                stats['peak_memory'] = executor.submit(run_instrumented, searcher, problem, timeout,
+                                                       memory_limit, True, instrument).result()['peak_memory']
+            record = dict(family=family, instance=instance, searcher=searcher_name)
+            record.update(stats)
+            record['found'] = stats['found'] is not None
+            records.append(record)
+            print('{:13} {:12} {:13} {}'.format(family, instance, searcher_name,
+                                                stats['error'] or '{:.4f}s'.format(stats['wall_time'])))
+    results = dict(commit=commit, date=datetime.datetime.now().isoformat(timespec='seconds'),
+                   python=platform.python_version(), machine=platform.platform(),
+                   timeout=timeout, memory_limit=memory_limit, records=records)
+    with open(filename, 'w') as f:
+        json.dump(results, f, indent=1)
+    print('Saved', len(records), 'results to', filename)
+    return results
+
+
+def compare_results(old_filename, new_filename):
+    """Print the time and node count changes between two bench_suite files."""
+    with open(old_filename) as f:
+        old = json.load(f)
+    with open(new_filename) as f:
+        new = json.load(f)
+    old_records = {(r['family'], r['instance'], r['searcher']): r for r in old['records']}
+    table = []
+    for r in new['records']:
+        o = old_records.get((r['family'], r['instance'], r['searcher']))
+        if o is None:
+            continue
+        if o['error'] or r['error']:
+            change = '{} -> {}'.format(o['error'] or 'ok', r['error'] or 'ok')
+        else:
+            change = '{:+.1f}%'.format(100 * (r['wall_time'] / o['wall_time'] - 1))
+        table.append([r['family'], r['instance'], r['searcher'], o['wall_time'], r['wall_time'], change,
+                      '{:+d}'.format(r['succs'] - o['succs'])])
+    print('old:', old['commit'], old['date'], ' new:', new['commit'], new['date'])
+    print_table(table, ['Family', 'Instance', 'Searcher', 'old s', 'new s', 'time', 'succs +/-'],
+                numfmt='{:.4g}')
+
+
+BENCHMARKS = {
+    'country_map_loading': bench_country_map_loading,
+    'random_graph': bench_random_graph,
+    'instrumentation_overhead': bench_instrumentation_overhead,
+    'checkpoint': bench_checkpoint,
+    'parallel_bfs': bench_parallel_bfs,
+    'sma_star': bench_sma_star,
+    'hda_star': bench_hda_star,
+    'hill_climbing_restarts': bench_hill_climbing_restarts,
+    'genetic_algorithm': bench_genetic_algorithm,
+    'island_genetic_algorithm': bench_island_genetic_algorithm,
+    'boggle': bench_boggle,
+}
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ['suite']:
+        bench_suite(*sys.argv[2:3])
+    elif sys.argv[1:2] == ['compare']:
+        compare_results(*sys.argv[2:4])
+    else:
+        for bench_name in sys.argv[1:] or BENCHMARKS:
+            print('==', bench_name)
+            BENCHMARKS[bench_name]()
+            print()
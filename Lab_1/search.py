@@ -7,7 +7,34 @@ functions.
 """
 
 import sys
+import os
+import signal
+import contextlib
+import json
+import csv
+import time
+import tracemalloc
+import pickle
+import shutil
+import struct
+import array
+import tempfile
+import functools
+import heapq
+import itertools
+import threading
+import contextvars
+import types
+import zlib
+import multiprocessing
+import queue
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
 
 from utils import *
 
@@ -67,6 +94,55 @@ class Problem:
         and related algorithms try to maximize this value."""
         raise NotImplementedError
 
+    def delta_value(self, state, action):
+        """How much the value changes by executing action in state, that is
+        value(result(state, action)) - value(state). Local search looks at
+        neighbors through this method, so override it if the change can be
+        computed without building the neighbor, as in NQueensLocalSearchProblem.
+        The default uses cached_value for both states."""
+        return self.cached_value(self.result(state, action)) - self.cached_value(state)
+
+    def random_action(self, state):
+        """One of self.actions(state), chosen uniformly at random, or None if
+        there are none. Override it if an action can be sampled without
+        listing them all."""
+        actions = self.actions(state)
+        return random.choice(actions) if actions else None
+
+    value_cache_size = 10000
+
+    def cached_value(self, state):
+        """self.value(state), remembered for the value_cache_size states most
+        recently asked about. Unhashable states, such as lists, are not
+        remembered: their value is computed every time."""
+        try:
+            cache = self.value_cache
+        except AttributeError:
+            cache = self.value_cache = collections.OrderedDict()
+        try:
+            value = cache[state]
+        except KeyError:
+            value = cache[state] = self.value(state)
+            if len(cache) > self.value_cache_size:
+                cache.popitem(last=False)
+            return value
+        except TypeError:
+            return self.value(state)
+        cache.move_to_end(state)
+        return value
+
+    # Hooks that the searchers call as their frontier and explored set change.
+    # They do nothing here; InstrumentedProblem uses them to keep statistics.
+
+    def frontier_push(self, node):
+        """Called when node is added to the frontier."""
+
+    def frontier_pop(self, node):
+        """Called when node is taken off (or deleted from) the frontier."""
+
+    def explored_add(self, state):
+        """Called when state is added to the explored set."""
+
 
 # ______________________________________________________________________________
 
@@ -99,6 +175,9 @@ class Node:
 
     def expand(self, problem):
         """List the nodes reachable in one step from this node."""
+        budget = search_budget.get()
+        if budget is not None:
+            budget.charge(self)
         return [self.child_node(problem, action)
                 for action in problem.actions(self.state)]
 
@@ -136,6 +215,230 @@ class Node:
         return hash(self.state)
 
 
+# ______________________________________________________________________________
+# Search budgets: node limits, deadlines and cancellation for any searcher
+
+
+class BudgetExhausted(Exception):
+    """Raised by SearchBudget.charge when the search has to stop."""
+
+
+class SearchBudget:
+    """Limits for one search: at most max_nodes node expansions, until
+    timeout seconds from the start of the search or an absolute deadline
+    (a time.monotonic() value), and until cancel.is_set() turns true (cancel
+    is typically a threading.Event set from another thread). Any limit can be
+    None. Pass it to a searcher as budget=SearchBudget(...); every node
+    expansion is charged to it, and when a limit is hit the searcher returns
+    a PartialResult instead of running on. The best node so far is the one
+    with the lowest key(node), by default the deepest one expanded."""
+
+    def __init__(self, max_nodes=None, timeout=None, deadline=None, cancel=None, key=None):
+        self.max_nodes = max_nodes
+        self.timeout = timeout
+        self.deadline = deadline
+        self.cancel = cancel
+        self.key = key or (lambda node: -node.depth)
+        self.start()
+
+    def start(self):
+        """Reset the counters; called by the searcher when it begins."""
+        self.started = time.monotonic()
+        self.stop_at = self.deadline
+        if self.timeout is not None:
+            end = self.started + self.timeout
+            self.stop_at = end if self.stop_at is None else min(self.stop_at, end)
+        self.nodes = 0
+        self.best = None
+        self.best_key = None
+
+    def charge(self, node):
+        """Count the expansion of node, or raise BudgetExhausted, without
+        counting it, if a limit is hit."""
+        key = self.key(node)
+        if self.best is None or key < self.best_key:
+            self.best, self.best_key = node, key
+        if self.max_nodes is not None and self.nodes >= self.max_nodes:
+            raise BudgetExhausted('nodes')
+        if self.stop_at is not None and time.monotonic() >= self.stop_at:
+            raise BudgetExhausted('deadline')
+        if self.cancel is not None and self.cancel.is_set():
+            raise BudgetExhausted('cancelled')
+        self.nodes += 1
+
+
+class PartialResult:
+    """What a searcher returns when its SearchBudget runs out. node is the
+    best node found so far (or None), reason is 'nodes', 'deadline' or
+    'cancelled', nodes is the number of expansions and elapsed the seconds
+    spent. A PartialResult is false, like the None of a failed search."""
+
+    def __init__(self, node, reason, nodes, elapsed):
+        self.node = node
+        self.reason = reason
+        self.nodes = nodes
+        self.elapsed = elapsed
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return '<PartialResult {} after {} nodes, {:.3f}s: {}>'.format(self.reason, self.nodes,
+                                                                     self.elapsed, self.node)
+
+
+# The budget of the search running in the current thread, charged by Node.expand.
+search_budget = contextvars.ContextVar('search_budget', default=None)
+
+
+def budgeted(searcher):
+    """Decorator that gives searcher a budget keyword argument (see
+    SearchBudget). Searchers called from within a budgeted search, such as
+    depth_limited_search inside iterative_deepening_search, are charged to
+    the same budget."""
+
+    @functools.wraps(searcher)
+    def budgeted_searcher(*args, budget=None, **kwargs):
+        if budget is None:
+            return searcher(*args, **kwargs)
+        budget.start()
+        token = search_budget.set(budget)
+        try:
+            return searcher(*args, **kwargs)
+        except BudgetExhausted as e:
+            return PartialResult(budget.best, e.args[0], budget.nodes, time.monotonic() - budget.started)
+        finally:
+            search_budget.reset(token)
+
+    return budgeted_searcher
+
+
+# ______________________________________________________________________________
+# Checkpoints: saving a long graph search to disk and resuming it
+
+
+def pack_values(values):
+    """Pack a list of states (or actions) into a NumPy array: an integer
+    matrix for tuples of ints of the same length, an int or str vector for
+    plain ints or strings, and for anything else the flat list pickled into a
+    byte array. unpack_values gives back equal values."""
+    kinds = {type(v) for v in values}
+    try:
+        if (kinds == {tuple} and len({len(v) for v in values}) == 1
+                and all(type(x) is int for v in values for x in v)):
+            array = np.array(values)
+            if array.ndim == 2 and array.dtype.kind == 'i':
+                return array.astype(np.min_scalar_type(-abs(array).max() - 1) if array.size else np.int8)
+        elif kinds == {int}:
+            return np.array(values, dtype=np.int64)
+        elif kinds == {str}:
+            return np.array(values, dtype=str)
+    except OverflowError:  # ints too big for int64
+        pass
+    return np.frombuffer(pickle.dumps(list(values), pickle.HIGHEST_PROTOCOL), dtype=np.uint8)
+
+
+def unpack_values(array):
+    """Inverse of pack_values."""
+    if array.dtype == np.uint8 and array.ndim == 1:
+        return pickle.loads(array.tobytes())
+    if array.ndim == 2:
+        return [tuple(row) for row in array.tolist()]
+    return array.tolist()
+
+
+class SearchCheckpoint:
+    """Saves the progress of a graph search to filename every interval
+    seconds, so that a search stopped by a crash or a restart can go on from
+    there. Pass it as checkpoint=SearchCheckpoint(...) to
+    breadth_first_graph_search, best_first_graph_search, uniform_cost_search
+    or astar_search: if filename exists the search resumes from it,
+    otherwise it starts from the beginning. The checkpoint must come from
+    the same searcher on the same problem.
+    The file is a NumPy .npz archive. Nodes are not pickled: every node on
+    the path to a frontier node is a row of flat arrays (state index, parent
+    row, action index, path cost), and the states themselves are packed by
+    pack_values. saves and save_time count the cost of checkpointing."""
+
+    def __init__(self, filename, interval=60.0):
+        self.filename = filename
+        self.interval = interval
+        self.last = time.monotonic()
+        self.saves = 0
+        self.save_time = 0.0
+
+    def due(self):
+        """Is it time to save again?"""
+        return time.monotonic() - self.last >= self.interval
+
+    def save(self, frontier, explored):
+        """Write the frontier nodes (in order) and the explored states to
+        filename. The old checkpoint is replaced only once the new one is
+        completely written."""
+        start = time.monotonic()
+        state_index, states = {}, []
+        action_index, actions = {}, []
+        node_row = {}  # id(node) -> row
+        rows = []
+        for node in frontier:
+            chain = []
+            while node is not None and id(node) not in node_row:
+                chain.append(node)
+                node = node.parent
+            for node in reversed(chain):  # parents get their rows first
+                node_row[id(node)] = len(rows)
+                rows.append(node)
+        for state in itertools.chain((node.state for node in rows), explored):
+            if state not in state_index:
+                state_index[state] = len(states)
+                states.append(state)
+        for node in rows:
+            if node.parent is not None and node.action not in action_index:
+                action_index[node.action] = len(actions)
+                actions.append(node.action)
+        costs = np.array([n.path_cost for n in rows])
+        if costs.dtype.kind not in 'iuf':
+            costs = pack_values([n.path_cost for n in rows])
+        arrays = dict(
+            states=pack_values(states),
+            actions=pack_values(actions),
+            node_state=np.array([state_index[n.state] for n in rows], dtype=np.int64),
+            node_parent=np.array([-1 if n.parent is None else node_row[id(n.parent)] for n in rows],
+                                 dtype=np.int64),
+            node_action=np.array([-1 if n.parent is None else action_index[n.action] for n in rows],
+                                 dtype=np.int64),
+            node_cost=costs,
+            frontier=np.array([node_row[id(n)] for n in frontier], dtype=np.int64),
+            explored=np.array([state_index[s] for s in explored], dtype=np.int64))
+        temporary = self.filename + '.tmp'
+        with open(temporary, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(temporary, self.filename)
+        self.saves += 1
+        self.last = time.monotonic()
+        self.save_time += self.last - start
+
+    def load(self):
+        """Return (frontier nodes, explored states) from filename, or None
+        if there is no checkpoint yet."""
+        if not os.path.exists(self.filename):
+            return None
+        with np.load(self.filename) as data:
+            states = unpack_values(data['states'])
+            actions = unpack_values(data['actions'])
+            rows = []
+            for s, parent, a, cost in zip(data['node_state'].tolist(), data['node_parent'].tolist(),
+                                          data['node_action'].tolist(), unpack_values(data['node_cost'])):
+                if parent < 0:
+                    rows.append(Node(states[s], path_cost=cost))
+                else:
+                    rows.append(Node(states[s], rows[parent], actions[a], cost))
+            frontier = [rows[i] for i in data['frontier'].tolist()]
+            explored = {states[i] for i in data['explored'].tolist()}
+        self.last = time.monotonic()
+        return frontier, explored
+
+
 # ______________________________________________________________________________
 
 
@@ -181,44 +484,55 @@ class SimpleProblemSolvingAgentProgram:
 # Uninformed Search algorithms
 
 
+@budgeted
 def breadth_first_tree_search(problem):
     """
     [Figure 3.7]
     Search the shallowest nodes in the search tree first.
     Search through the successors of a problem to find a goal.
     The argument frontier should be an empty queue.
-    Repeats infinitely in case of loops.
+    Repeats infinitely in case of loops, unless given a budget.
     """
 
     frontier = deque([Node(problem.initial)])  # FIFO queue
+    problem.frontier_push(frontier[0])
 
     while frontier:
         node = frontier.popleft()
+        problem.frontier_pop(node)
         if problem.goal_test(node.state):
             return node
-        frontier.extend(node.expand(problem))
+        for child in node.expand(problem):
+            frontier.append(child)
+            problem.frontier_push(child)
     return None
 
 
+@budgeted
 def depth_first_tree_search(problem):
     """
     [Figure 3.7]
     Search the deepest nodes in the search tree first.
     Search through the successors of a problem to find a goal.
     The argument frontier should be an empty queue.
-    Repeats infinitely in case of loops.
+    Repeats infinitely in case of loops, unless given a budget.
     """
 
     frontier = [Node(problem.initial)]  # Stack
+    problem.frontier_push(frontier[0])
 
     while frontier:
         node = frontier.pop()
+        problem.frontier_pop(node)
         if problem.goal_test(node.state):
             return node
-        frontier.extend(node.expand(problem))
+        for child in node.expand(problem):
+            frontier.append(child)
+            problem.frontier_push(child)
     return None
 
 
+@budgeted
 def depth_first_graph_search(problem):
     """
     [Figure 3.7]
@@ -229,15 +543,20 @@ def depth_first_graph_search(problem):
     If two paths reach a state, only use the first one.
     """
     frontier = [(Node(problem.initial))]  # Stack
+    problem.frontier_push(frontier[0])
 
     explored = set()
     while frontier:
         node = frontier.pop()
+        problem.frontier_pop(node)
         if problem.goal_test(node.state):
             return node
         explored.add(node.state)
-        frontier.extend(child for child in node.expand(problem)
-                        if child.state not in explored and child not in frontier)
+        problem.explored_add(node.state)
+        for child in node.expand(problem):
+            if child.state not in explored and child not in frontier:
+                frontier.append(child)
+                problem.frontier_push(child)
     return None
 
 
@@ -246,6 +565,7 @@ def depth_first_graph_search(problem):
 
 
 
+@budgeted
 def random_search(problem, step_limits = -1):
 
     node = Node(problem.initial)
@@ -270,68 +590,132 @@ def random_search(problem, step_limits = -1):
 
 
 
-def breadth_first_graph_search(problem, step_limits = -1):
+@budgeted
+def breadth_first_graph_search(problem, step_limits = -1, checkpoint=None):
     """[Figure 3.11]
     Note that this function can be implemented in a
     single line as below:
     return graph_search(problem, FIFOQueue())
+    With checkpoint=SearchCheckpoint(...) the search is saved to disk at
+    intervals and resumed from there when restarted.
     """
     node = Node(problem.initial)
     if problem.goal_test(node.state):
         return node
     frontier = deque([node])
     explored = set()
+    saved = checkpoint.load() if checkpoint is not None else None
+    if saved is not None:
+        frontier, explored = deque(saved[0]), saved[1]
+    for node in frontier:
+        problem.frontier_push(node)
     step_num = 0
     while frontier:
+        if checkpoint is not None and checkpoint.due():
+            checkpoint.save(frontier, explored)
         step_num = step_num + 1
         node = frontier.popleft()
+        problem.frontier_pop(node)
         if step_limits > 0 and step_num >= step_limits:  # its for debug
             return node
 
         explored.add(node.state)
+        problem.explored_add(node.state)
         for child in node.expand(problem):
             if child.state not in explored and child not in frontier:
                 if problem.goal_test(child.state):
                     return child
                 frontier.append(child)
+                problem.frontier_push(child)
     return None
 
 
-def best_first_graph_search(problem, f, display=False):
+@budgeted
+def best_first_graph_search(problem, f, display=False, checkpoint=None):
     """Search the nodes with the lowest f scores first.
     You specify the function f(node) that you want to minimize; for example,
     if f is a heuristic estimate to the goal, then we have greedy best
     first search; if f is node.depth then we have breadth-first search.
     There is a subtlety: the line "f = memoize(f, 'f')" means that the f
     values will be cached on the nodes as they are computed. So after doing
-    a best first search you can examine the f values of the path returned."""
+    a best first search you can examine the f values of the path returned.
+    With checkpoint=SearchCheckpoint(...) the search is saved to disk at
+    intervals and resumed from there when restarted."""
     f = memoize(f, 'f')
-    node = Node(problem.initial)
     frontier = PriorityQueue('min', f)
-    frontier.append(node)
     explored = set()
+    saved = checkpoint.load() if checkpoint is not None else None
+    if saved is not None:
+        frontier.extend(saved[0])
+        explored = saved[1]
+    else:
+        frontier.append(Node(problem.initial))
+    for _, node in frontier.heap:
+        problem.frontier_push(node)
     while frontier:
+        if checkpoint is not None and checkpoint.due():
+            checkpoint.save([node for _, node in frontier.heap], explored)
         node = frontier.pop()
+        problem.frontier_pop(node)
         if problem.goal_test(node.state):
             if display:
                 print(len(explored), "paths have been expanded and", len(frontier), "paths remain in the frontier")
             return node
         explored.add(node.state)
+        problem.explored_add(node.state)
         for child in node.expand(problem):
             if child.state not in explored and child not in frontier:
                 frontier.append(child)
+                problem.frontier_push(child)
             elif child in frontier:
                 if f(child) < frontier[child]:
                     del frontier[child]
+                    problem.frontier_pop(child)
                     frontier.append(child)
+                    problem.frontier_push(child)
     return None
 
 
-def uniform_cost_search(problem, display=False):
+@budgeted
+def uniform_cost_search(problem, display=False, checkpoint=None):
     """[Figure 3.14]"""
-    return best_first_graph_search(problem, lambda node: node.path_cost, display)
+    return best_first_graph_search(problem, lambda node: node.path_cost, display, checkpoint)
+
+
+@budgeted
+def uniform_cost_search_many(problem, goals):
+    """One source, many goals: a single uniform cost (Dijkstra) search from
+    problem.initial that answers every state in goals from the same search
+    tree. problem.goal is ignored. The search stops as soon as all goals are
+    settled. Return a dict of {goal: Node}, with None for unreachable goals;
+    each Node has the same path_cost uniform_cost_search would find."""
+    remaining = set(goals)
+    found = {goal: None for goal in goals}
+    root = Node(problem.initial)
+    best = {root.state: 0}
+    frontier = [(0, 0, root)]
+    problem.frontier_push(root)
+    explored = set()
+    counter = itertools.count(1)  # breaks ties without comparing nodes
+    while frontier and remaining:
+        cost, _, node = heapq.heappop(frontier)
+        problem.frontier_pop(node)
+        if node.state in explored:
+            continue
+        explored.add(node.state)
+        problem.explored_add(node.state)
+        if node.state in remaining:
+            found[node.state] = node
+            remaining.discard(node.state)
+        for child in node.expand(problem):
+            if child.state not in explored and child.path_cost < best.get(child.state, np.inf):
+                best[child.state] = child.path_cost
+                heapq.heappush(frontier, (child.path_cost, next(counter), child))
+                problem.frontier_push(child)
+    return found
 
 
+@budgeted
 def depth_limited_search(problem, limit=50):
     """[Figure 3.17]"""
 
@@ -354,6 +738,7 @@ def depth_limited_search(problem, limit=50):
     return recursive_dls(Node(problem.initial), problem, limit)
 
 
+@budgeted
 def iterative_deepening_search(problem):
     """[Figure 3.18]"""
     for depth in range(sys.maxsize):
@@ -366,6 +751,7 @@ def iterative_deepening_search(problem):
 # Bidirectional Search
 # Pseudocode from https://webdocs.cs.ualberta.ca/%7Eholte/Publications/MM-AAAI2016.pdf
 
+@budgeted
 def bidirectional_search(problem):
     e = 0
     if isinstance(problem, GraphProblem):
@@ -442,6 +828,264 @@ def bidirectional_search(problem):
     return np.inf
 
 
+# ______________________________________________________________________________
+# External-memory breadth-first search: for state spaces bigger than RAM
+
+
+RECORD_LENGTH = struct.Struct('<II')
+
+
+def write_records(filename, records):
+    """Write (state bytes, parent bytes) pairs to filename; return how many."""
+    count = 0
+    with open(filename, 'wb') as f:
+        for state, parent in records:
+            f.write(RECORD_LENGTH.pack(len(state), len(parent)))
+            f.write(state)
+            f.write(parent)
+            count += 1
+    return count
+
+
+def read_records(filename):
+    """Yield the (state bytes, parent bytes) pairs of a write_records file."""
+    with open(filename, 'rb') as f:
+        while True:
+            header = f.read(RECORD_LENGTH.size)
+            if not header:
+                return
+            state_length, parent_length = RECORD_LENGTH.unpack(header)
+            yield f.read(state_length), f.read(parent_length)
+
+
+@budgeted
+def external_breadth_first_search(problem, directory=None, buffer_size=1000000, locality=None,
+                                  encode=pickle.dumps, decode=pickle.loads, layer_sizes=None):
+    """Breadth-first graph search that keeps its layers on disk rather than
+    in memory, with delayed duplicate detection: the successors of a layer
+    are streamed into sorted runs of at most buffer_size states, and the
+    runs are merged into the next layer file, dropping the states already in
+    one of the previous locality layers (all of them if None; 2 is enough
+    when every action can be undone, as in EightPuzzle or a GraphProblem).
+    Only buffer_size states are in memory at any time. States are stored as
+    encode(state), so equal states must encode to equal bytes; the default
+    pickle does for tuples of numbers and for strings. The files go to a
+    temporary directory inside directory and are deleted at the end. If
+    layer_sizes is a list, the number of states in each layer is appended to
+    it as the search goes."""
+    root = Node(problem.initial)
+    if problem.goal_test(root.state):
+        return root
+    workdir = tempfile.mkdtemp(prefix='bfs_', dir=directory)
+    try:
+        layers = [os.path.join(workdir, 'layer0')]
+        write_records(layers[0], [(encode(root.state), b'')])
+        if layer_sizes is not None:
+            layer_sizes.append(1)
+        while True:
+            runs, buffer, goal = [], [], None
+
+            def flush():
+                buffer.sort()
+                runs.append(os.path.join(workdir, 'run{}'.format(len(runs))))
+                write_records(runs[-1], buffer)
+                buffer.clear()
+
+            for state, _ in read_records(layers[-1]):
+                for child in Node(decode(state)).expand(problem):
+                    buffer.append((encode(child.state), state))
+                    if problem.goal_test(child.state):
+                        goal = buffer[-1]
+                        break
+                    if len(buffer) >= buffer_size:
+                        flush()
+                if goal:
+                    break
+            if goal:
+                return external_solution(problem, layers, goal, decode)
+            flush()
+            older = layers if locality is None else layers[-locality:]
+            layers.append(os.path.join(workdir, 'layer{}'.format(len(layers))))
+            size = write_records(layers[-1], new_states(runs, older))
+            for run in runs:
+                os.remove(run)
+            if layer_sizes is not None:
+                layer_sizes.append(size)
+            if size == 0:
+                return None
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def new_states(runs, layers):
+    """Merge the sorted runs into one sorted stream of (state, parent)
+    records, without duplicates and without the states of the given layers."""
+    seen = heapq.merge(*[(state for state, _ in read_records(layer)) for layer in layers])
+    old = next(seen, None)
+    last = None
+    for state, parent in heapq.merge(*[read_records(run) for run in runs]):
+        if state == last:
+            continue
+        last = state
+        while old is not None and old < state:
+            old = next(seen, None)
+        if old != state:
+            yield state, parent
+
+
+def external_solution(problem, layers, goal, decode):
+    """Rebuild the path to goal, a (state, parent) record, by looking up each
+    parent in the layer before, and replay it from the initial state."""
+    path = [goal[0]]
+    parent = goal[1]
+    for layer in reversed(layers):
+        path.append(parent)
+        for state, grandparent in read_records(layer):
+            if state == parent:
+                parent = grandparent
+                break
+    path.reverse()
+    node = Node(problem.initial)
+    for state in map(decode, path[1:]):
+        node = next(child for child in (node.child_node(problem, action)
+                                        for action in problem.actions(node.state))
+                    if child.state == state)
+    return node
+
+
+# ______________________________________________________________________________
+# Parallel breadth-first search: one layer at a time, with the states
+# partitioned by hash across worker processes
+
+
+def state_owner(state, workers):
+    """The worker that owns state. zlib.crc32 rather than hash, which differs
+    between processes for strings."""
+    return zlib.crc32(pickle.dumps(state)) % workers
+
+
+def check_workers(processes):
+    """Raise RuntimeError if any of the worker processes has exited; they
+    only exit when told to stop, so one that did was killed or crashed."""
+    for i, process in enumerate(processes):
+        if process.exitcode is not None:
+            raise RuntimeError('Worker {} exited with code {}'.format(i, process.exitcode))
+
+
+def receive(results, processes, poll=0.1):
+    """The next message on the results queue, checking every poll seconds
+    that the worker processes are still alive (see check_workers). A
+    message tagged 'error' has the worker's exception, which is raised."""
+    while True:
+        try:
+            message = results.get(timeout=poll)
+        except queue.Empty:
+            check_workers(processes)
+            continue
+        if message[0] == 'error':
+            raise message[2]
+        return message
+
+
+def parallel_bfs_worker(problem, index, workers, commands, inboxes, results):
+    """Worker process of parallel_breadth_first_search. It owns the states
+    whose state_owner is index: it remembers how each was first reached and
+    holds those of the current layer."""
+    parents = {}  # state -> (parent state, action), None for the initial state
+    layer = []
+    try:
+        while True:
+            command, arg = commands.get()
+            if command == 'start':
+                parents[arg] = None
+                layer = [arg]
+            elif command == 'expand':
+                outgoing = [[] for _ in range(workers)]
+                for state in layer:
+                    for action in problem.actions(state):
+                        child = problem.result(state, action)
+                        outgoing[state_owner(child, workers)].append((child, state, action))
+                for i, batch in enumerate(outgoing):
+                    inboxes[i].put((index, batch))
+                incoming = sorted((inboxes[index].get() for _ in range(workers)), key=lambda b: b[0])
+                layer, goal = [], None
+                for _, batch in incoming:
+                    for child, state, action in batch:
+                        if child not in parents:
+                            parents[child] = (state, action)
+                            layer.append(child)
+                            if goal is None and problem.goal_test(child):
+                                goal = child
+                results.put(('layer', index, len(layer), goal))
+            elif command == 'parent':
+                results.put(('parent', index, parents[arg]))
+            else:
+                return
+    except Exception as e:
+        results.put(('error', index, e))
+
+
+def parallel_breadth_first_search(problem, workers=None, layer_sizes=None):
+    """Breadth-first graph search spread over worker processes (by default
+    one per CPU). Each state belongs to one worker, chosen by hashing it;
+    layer by layer, every worker expands its states of the current layer and
+    sends each child to its owner, which drops the ones it has already seen.
+    Returns a shortest solution, like breadth_first_graph_search, but not
+    necessarily the same one when there are several. The problem, its states
+    and actions must be picklable. If layer_sizes is a list, the number of
+    states in each layer is appended to it. An exception in a worker is
+    raised here; a worker that dies without one raises RuntimeError."""
+    root = Node(problem.initial)
+    if problem.goal_test(root.state):
+        return root
+    workers = workers or os.cpu_count()
+    commands = [multiprocessing.Queue() for _ in range(workers)]
+    inboxes = [multiprocessing.Queue() for _ in range(workers)]
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=parallel_bfs_worker,
+                                         args=(problem, i, workers, commands[i], inboxes, results),
+                                         daemon=True)
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        commands[state_owner(root.state, workers)].put(('start', root.state))
+        if layer_sizes is not None:
+            layer_sizes.append(1)
+        while True:
+            for command_queue in commands:
+                command_queue.put(('expand', None))
+            replies = sorted(receive(results, processes)[1:] for _ in range(workers))
+            size = sum(size for _, size, _ in replies)
+            if layer_sizes is not None:
+                layer_sizes.append(size)
+            goals = [goal for _, _, goal in replies if goal is not None]
+            if goals:
+                break
+            if size == 0:
+                return None
+        actions = []
+        state = goals[0]
+        while True:
+            commands[state_owner(state, workers)].put(('parent', state))
+            parent = receive(results, processes)[2]
+            if parent is None:
+                break
+            state, action = parent
+            actions.append(action)
+        node = root
+        for action in reversed(actions):
+            node = node.child_node(problem, action)
+        return node
+    finally:
+        for command_queue in commands:
+            command_queue.put(('stop', None))
+        for process in processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+
+
 # ______________________________________________________________________________
 # Informed (Heuristic) Search
 
@@ -452,12 +1096,433 @@ greedy_best_first_graph_search = best_first_graph_search
 # Greedy best-first search is accomplished by specifying f(n) = h(n).
 
 
-def astar_search(problem, h=None, display=False):
+@budgeted
+def astar_search(problem, h=None, display=False, checkpoint=None):
     """A* search is best-first graph search with f(n) = g(n)+h(n).
     You need to specify the h function when you call astar_search, or
     else in your Problem subclass."""
     h = memoize(h or problem.h, 'h')
-    return best_first_graph_search(problem, lambda n: n.path_cost + h(n), display)
+    return best_first_graph_search(problem, lambda n: n.path_cost + h(n), display, checkpoint)
+
+
+def anytime_astar_search(problem, h=None, weight=3.0, step=0.5):
+    """Anytime Repairing A* (ARA*): a generator of successively better
+    solutions. It starts as weighted A* with f(n) = g(n) + weight * h(n),
+    which finds a solution fast, then lowers the weight by step down to 1.
+    Each round reuses the search tree of the previous ones: only the states
+    whose cost improved since they were expanded are looked at again.
+    Whenever a round improves on the last answer it yields (node, bound),
+    where node is the best goal node so far and its path cost is at most
+    bound times the optimal cost (bound 1 means optimal). h must be
+    admissible for the bounds to hold.
+    Stop iterating whenever the answer is good enough or time is up."""
+    h = h or problem.h
+    hs = {}
+
+    def h_of(node):
+        if node.state not in hs:
+            hs[node.state] = h(node)
+        return hs[node.state]
+
+    root = Node(problem.initial)
+    best = {root.state: root}  # the cheapest node found for every state
+    goal = root if problem.goal_test(root.state) else None
+    open_keys = {}  # state -> f of its current entry in the heap
+    heap = []
+    counter = itertools.count()  # breaks ties between equal f without comparing nodes
+    closed, incons = set(), set()
+
+    def push(node):
+        key = node.path_cost + weight * h_of(node)
+        if node.state not in open_keys:
+            problem.frontier_push(node)
+        open_keys[node.state] = key
+        heapq.heappush(heap, (key, next(counter), node.state))
+
+    def min_open_key():
+        while heap and open_keys.get(heap[0][2]) != heap[0][0]:
+            heapq.heappop(heap)  # stale entry
+        return heap[0][0] if heap else np.inf
+
+    def improve_path():
+        nonlocal goal
+        while min_open_key() < (goal.path_cost if goal else np.inf):
+            state = heapq.heappop(heap)[2]
+            del open_keys[state]
+            node = best[state]
+            problem.frontier_pop(node)
+            closed.add(state)
+            problem.explored_add(state)
+            for child in node.expand(problem):
+                old = best.get(child.state)
+                if old is not None and old.path_cost <= child.path_cost:
+                    continue
+                best[child.state] = child
+                if problem.goal_test(child.state):
+                    if goal is None or child.path_cost < goal.path_cost:
+                        goal = child
+                    continue
+                if child.state in closed:
+                    incons.add(child.state)
+                else:
+                    push(child)
+
+    def bound():
+        """goal.path_cost over a lower bound on the optimal cost."""
+        lowest = min([goal.path_cost] + [best[s].path_cost + h_of(best[s])
+                                         for s in itertools.chain(open_keys, incons)])
+        if lowest <= 0:
+            return 1.0 if goal.path_cost <= 0 else weight
+        return max(1.0, min(weight, goal.path_cost / lowest))
+
+    if goal is not None:
+        yield goal, 1.0
+        return
+    push(root)
+    last = None
+    while True:
+        improve_path()
+        if goal is None:
+            return
+        epsilon = bound()
+        if last is None or goal is not last[0] or epsilon < last[1]:
+            last = goal, epsilon
+            yield last
+        if epsilon <= 1 or weight <= 1:
+            return
+        # Next round: a lower weight, with every inconsistent state back on OPEN.
+        weight = max(1.0, weight - step)
+        heap.clear()
+        for state in list(open_keys) + list(incons - open_keys.keys()):
+            push(best[state])
+        incons.clear()
+        closed.clear()
+
+
+@budgeted
+def beam_search(problem, k=10, h=None, f=None):
+    """Beam search: breadth-first, one layer at a time, but only the k nodes
+    of each layer with the lowest f(n) are kept, so the frontier never grows
+    past k nodes. f defaults to g(n)+h(n). The k best of a layer are picked
+    from an array of its f values with np.argpartition, without sorting the
+    layer. Neither complete nor optimal: when the way to the goal is pruned
+    away the beam eventually runs dry and the search returns None."""
+    h = memoize(h or problem.h, 'h')
+    f = f or (lambda n: n.path_cost + h(n))
+    node = Node(problem.initial)
+    if problem.goal_test(node.state):
+        return node
+    beam = [node]
+    problem.frontier_push(node)
+    explored = {node.state}
+    while beam:
+        layer = {}
+        for node in beam:
+            problem.frontier_pop(node)
+            problem.explored_add(node.state)
+            for child in node.expand(problem):
+                if child.state in explored:
+                    continue
+                if problem.goal_test(child.state):
+                    return child
+                old = layer.get(child.state)
+                if old is None or child.path_cost < old.path_cost:
+                    layer[child.state] = child
+        beam = list(layer.values())
+        if len(beam) > k:
+            scores = np.fromiter(map(f, beam), dtype=float, count=len(beam))
+            beam = [beam[i] for i in np.argpartition(scores, k - 1)[:k]]
+        for node in beam:
+            explored.add(node.state)
+            problem.frontier_push(node)
+    return None
+
+
+@budgeted
+def sma_star_search(problem, max_nodes=1000, h=None):
+    """Simplified Memory-bounded A* (SMA*): A* that never holds more than
+    max_nodes nodes in memory. It generates one successor at a time, and when
+    memory is full it forgets the worst leaf (highest f, then shallowest),
+    backing the leaf's f value up to its parent, which regenerates the leaf
+    only once every other way looks worse. Nodes at depth max_nodes - 1 can't
+    be expanded, so get f = infinity unless they are goals. A successor whose
+    state is already in memory by a path no more costly (such as an ancestor,
+    on a cycle) is dropped; one that is cheaper replaces the node in memory
+    together with its descendants. With an admissible h it returns an
+    optimal solution if one fits within that depth, otherwise the best
+    solution that fits, or None."""
+    if max_nodes < 2:
+        raise ValueError('SMA* needs room for at least 2 nodes')
+    h = h or problem.h
+    counter = itertools.count()
+    open_heap = []  # (f, -depth, version, node): lowest f, then deepest first
+    leaf_heap = []  # (-f, depth, version, node): highest f, then shallowest first
+    memory = {}  # state -> the node in memory with that state
+
+    def push(node):
+        """(Re)insert node in the heaps it belongs to; older entries go stale."""
+        node.version = next(counter)
+        if node.open:
+            heapq.heappush(open_heap, (node.f, -node.depth, node.version, node))
+        if not node.children:
+            heapq.heappush(leaf_heap, (-node.f, node.depth, node.version, node))
+
+    def add(node, f):
+        node.goal = problem.goal_test(node.state)
+        node.actions = problem.actions(node.state)
+        if not node.goal and (not node.actions or node.depth >= max_nodes - 1):
+            f = np.inf
+        node.f = f
+        node.next = 0  # index of the next action never tried
+        node.children = {}  # action index -> child in memory
+        node.forgotten = {}  # action index -> backed up f of a forgotten child
+        node.alive = node.open = True
+        memory[node.state] = node
+        problem.frontier_push(node)
+        push(node)
+
+    def backup(node):
+        """Once all of node's successors were generated, its f is the lowest
+        f among them; pass any change on to the ancestors."""
+        while node is not None and node.next == len(node.actions):
+            f = min(itertools.chain((c.f for c in node.children.values()), node.forgotten.values()),
+                    default=np.inf)
+            if f == node.f:
+                break
+            node.f = f
+            push(node)
+            node = node.parent
+
+    def forget_worst_leaf():
+        while True:
+            _, _, version, leaf = heapq.heappop(leaf_heap)
+            if leaf.alive and not leaf.children and version == leaf.version and leaf is not root:
+                break
+        leaf.alive = False
+        del memory[leaf.state]
+        if leaf.open:
+            problem.frontier_pop(leaf)
+        parent = leaf.parent
+        del parent.children[leaf.index]
+        parent.forgotten[leaf.index] = leaf.f
+        if not parent.open:
+            parent.open = True
+            problem.frontier_push(parent)
+        push(parent)
+
+    def remove(node):
+        """Drop node and its descendants, for a cheaper path to node.state
+        was found; the parent does without it. Return how many were dropped."""
+        dropped = [node]
+        for n in dropped:
+            n.alive = False
+            del memory[n.state]
+            if n.open:
+                problem.frontier_pop(n)
+            dropped.extend(n.children.values())
+        parent = node.parent
+        del parent.children[node.index]
+        push(parent)
+        backup(parent)
+        return len(dropped)
+
+    root = Node(problem.initial)
+    add(root, h(root))
+    used = 1
+    while True:
+        while open_heap:
+            _, _, version, node = open_heap[0]
+            if node.alive and node.open and version == node.version:
+                break
+            heapq.heappop(open_heap)
+        else:
+            return None
+        if node.f == np.inf:
+            return None
+        if node.goal:
+            return node
+        charge_search_budget(node)
+        if node.next < len(node.actions):
+            i = node.next
+            node.next += 1
+            child = node.child_node(problem, node.actions[i])
+            f = max(node.f, child.path_cost + h(child))
+        else:
+            i = min(node.forgotten, key=node.forgotten.get)
+            child = node.child_node(problem, node.actions[i])
+            f = node.forgotten.pop(i)
+        other = memory.get(child.state)
+        if other is not None and other.path_cost > child.path_cost:
+            used -= remove(other)
+            other = None
+        if other is None:
+            child.index = i
+            node.children[i] = child
+            add(child, f)
+            used += 1
+        if node.next == len(node.actions) and not node.forgotten:
+            node.open = False  # every successor is in memory
+            problem.frontier_pop(node)
+        push(node)
+        backup(node)
+        while used > max_nodes:
+            forget_worst_leaf()
+            used -= 1
+
+
+# ______________________________________________________________________________
+# Hash Distributed A* (HDA*): A* spread over processes, with the states
+# partitioned by hash as in parallel_breadth_first_search
+
+
+def hda_star_worker(problem, index, workers, h, batch_size, inboxes, commands, results, shared):
+    """Worker process of hda_star_search: A* on the states whose state_owner
+    is index, with its own open list and g values. Children owned by other
+    workers are sent to them in batches. idle[index] is 1 while there is
+    nothing worth expanding and nothing left to send."""
+    incumbent, lock, idle, sent, received, stop = shared
+    h = h or problem.h
+    g_of, parents, frontier = {}, {}, []
+    counter = itertools.count()
+    outgoing = [[] for _ in range(workers)]
+    inbox = inboxes[index]
+    goal = None
+
+    def reach(state, g, parent):
+        if g < g_of.get(state, np.inf):
+            g_of[state] = g
+            parents[state] = parent
+            f = g + h(Node(state, path_cost=g))
+            if f < incumbent.value:
+                heapq.heappush(frontier, (f, next(counter), g, state))
+
+    def flush():
+        for i, batch in enumerate(outgoing):
+            if batch:
+                sent[index] += 1
+                inboxes[i].put(batch)
+                outgoing[i] = []
+
+    try:
+        if state_owner(problem.initial, workers) == index:
+            reach(problem.initial, 0, None)
+        expansions = 0
+        while not stop.is_set():
+            try:
+                batch = inbox.get(timeout=0.001) if idle[index] else inbox.get_nowait()
+            except queue.Empty:
+                batch = None
+            if batch is not None:
+                idle[index] = 0
+                received[index] += 1
+                for state, g, parent in batch:
+                    reach(state, g, parent)
+                continue
+            while frontier and (frontier[0][0] >= incumbent.value or frontier[0][2] > g_of[frontier[0][3]]):
+                heapq.heappop(frontier)  # can't beat the incumbent, or stale
+            if not frontier:
+                flush()
+                idle[index] = 1
+                continue
+            _, _, g, state = heapq.heappop(frontier)
+            if problem.goal_test(state):
+                with lock:
+                    if g < incumbent.value:
+                        incumbent.value = g
+                        goal = (g, state)
+                continue
+            for action in problem.actions(state):
+                child = problem.result(state, action)
+                owner = state_owner(child, workers)
+                cost = problem.path_cost(g, state, action, child)
+                if owner == index:
+                    reach(child, cost, (state, action))
+                else:
+                    outgoing[owner].append((child, cost, (state, action)))
+            expansions += 1
+            if expansions % batch_size == 0:
+                flush()
+        results.put(('goal', index, goal))
+        for command, arg in iter(commands.get, ('stop', None)):
+            results.put(('parent', index, parents[arg]))
+    except Exception as e:
+        results.put(('error', index, e))
+
+
+def hda_star_search(problem, h=None, workers=None, batch_size=64):
+    """Hash Distributed A* (HDA*): A* search spread over worker processes (by
+    default one per CPU). Every state is owned by one worker, which keeps it
+    in its own open and closed lists; the children a worker generates are
+    sent, asynchronously and in batches of up to batch_size expansions, to
+    their owners. Goals found lower a shared incumbent cost, and every
+    worker drops the nodes whose f can't beat it. The search ends when all
+    workers are idle and no batch is on its way, which proves the incumbent
+    optimal when h is admissible. The problem, h, states and actions must be
+    picklable. An exception in a worker is raised here; a worker that dies
+    without one raises RuntimeError."""
+    root = Node(problem.initial)
+    if problem.goal_test(root.state):
+        return root
+    workers = workers or os.cpu_count()
+    inboxes = [multiprocessing.Queue() for _ in range(workers)]
+    commands = [multiprocessing.Queue() for _ in range(workers)]
+    results = multiprocessing.Queue()
+    idle = multiprocessing.RawArray('b', workers)
+    sent = multiprocessing.RawArray('q', workers)
+    received = multiprocessing.RawArray('q', workers)
+    stop = multiprocessing.Event()
+    shared = (multiprocessing.RawValue('d', np.inf), multiprocessing.Lock(), idle, sent, received, stop)
+    processes = [multiprocessing.Process(target=hda_star_worker,
+                                         args=(problem, i, workers, h, batch_size, inboxes, commands[i],
+                                               results, shared),
+                                         daemon=True)
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        # Done when two snapshots in a row show every worker idle and as many
+        # batches received as sent: nothing changed between them, so at that
+        # point no worker had work and no batch was in flight.
+        last = None
+        while True:
+            try:
+                _, _, error = results.get(timeout=0.001)
+                raise error  # the only message during the search
+            except queue.Empty:
+                check_workers(processes)  # a dead worker would never go idle
+            snapshot = (tuple(idle), tuple(sent), tuple(received))
+            if all(snapshot[0]) and sum(snapshot[1]) == sum(snapshot[2]) and snapshot == last:
+                break
+            last = snapshot
+        stop.set()
+        goals = []
+        for _ in range(workers):
+            _, _, goal = receive(results, processes)
+            if goal is not None:
+                goals.append(goal)
+        if not goals:
+            return None
+        actions = []
+        state = min(goals, key=lambda goal: goal[0])[1]
+        while True:
+            commands[state_owner(state, workers)].put(('parent', state))
+            parent = receive(results, processes)[2]
+            if parent is None:
+                break
+            state, action = parent
+            actions.append(action)
+        node = root
+        for action in reversed(actions):
+            node = node.child_node(problem, action)
+        return node
+    finally:
+        stop.set()
+        for command_queue in commands:
+            command_queue.put(('stop', None))
+        for process in processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
 
 
 # ______________________________________________________________________________
@@ -703,6 +1768,7 @@ class PlanRoute(Problem):
 # Other search algorithms
 
 
+@budgeted
 def recursive_best_first_search(problem, h=None):
     """[Figure 3.26]"""
     h = memoize(h or problem.h, 'h')
@@ -735,63 +1801,376 @@ def recursive_best_first_search(problem, h=None):
     return result
 
 
+def charge_search_budget(node):
+    """Charge the expansion of node to the budget of the running search, for
+    searchers that don't go through Node.expand."""
+    budget = search_budget.get()
+    if budget is not None:
+        budget.charge(node)
+
+
+def best_actions(problem, state):
+    """The actions with the highest delta_value in state, and that delta (None
+    if there are no actions)."""
+    best, best_delta = [], None
+    for action in problem.actions(state):
+        delta = problem.delta_value(state, action)
+        if best_delta is None or delta > best_delta:
+            best, best_delta = [action], delta
+        elif delta == best_delta:
+            best.append(action)
+    return best, best_delta
+
+
+@budgeted
 def hill_climbing(problem):
     """
     [Figure 4.2]
     From the initial node, keep choosing the neighbor with highest value,
-    stopping when no neighbor is better.
+    stopping when no neighbor is better. Neighbors are compared by
+    problem.delta_value, without building them.
     """
     current = Node(problem.initial)
     while True:
-        neighbors = current.expand(problem)
-        if not neighbors:
+        charge_search_budget(current)
+        actions, delta = best_actions(problem, current.state)
+        if not actions or delta <= 0:
             break
-        neighbor = argmax_random_tie(neighbors, key=lambda node: problem.value(node.state))
-        if problem.value(neighbor.state) <= problem.value(current.state):
+        current = current.child_node(problem, random.choice(actions))
+    return current.state
+
+
+@budgeted
+def hill_climbing_sideways(problem, max_sideways=100):
+    """Steepest-ascent hill climbing that also moves sideways, to a neighbor
+    of equal value, when no neighbor is better; at most max_sideways times
+    in a row, so it can't wander a plateau forever. [Section 4.1.1]"""
+    current = Node(problem.initial)
+    sideways = 0
+    while True:
+        charge_search_budget(current)
+        actions, delta = best_actions(problem, current.state)
+        if not actions or delta < 0 or (delta == 0 and sideways == max_sideways):
             break
-        current = neighbor
+        sideways = sideways + 1 if delta == 0 else 0
+        current = current.child_node(problem, random.choice(actions))
     return current.state
 
 
+@budgeted
+def first_choice_hill_climbing(problem, max_tries=None):
+    """Stochastic hill climbing that tries neighbors in random order and moves
+    to the first one that is better, rather than looking at them all; good
+    when states have many neighbors. Stops when none of max_tries random
+    neighbors (by default, none of them at all) is better. [Section 4.1.1]"""
+    current = Node(problem.initial)
+    while True:
+        charge_search_budget(current)
+        actions = list(problem.actions(current.state))
+        random.shuffle(actions)
+        for action in actions[:max_tries]:
+            if problem.delta_value(current.state, action) > 0:
+                current = current.child_node(problem, action)
+                break
+        else:
+            return current.state
+
+
+def hill_climbing_restarts(problem, restarts=1000, starts=None, seed=None):
+    """Random-restart hill climbing on a PeakFindingProblem, with all the
+    runs climbing at once: their positions are rows of a NumPy array, and
+    each step looks up the values of every run's neighbors in the grid with
+    fancy indexing. Like hill_climbing, each run moves to its best neighbor
+    (ties broken at random) until no neighbor is higher. The runs start from
+    problem.initial and restarts - 1 random cells, or from the rows of
+    starts if given. Returns (peak, runs): the highest peak reached, and a
+    dict of per-run arrays 'start', 'peak', 'value' and 'steps'."""
+    rng = np.random.default_rng(seed)
+    grid = np.asarray(problem.grid)
+    n, m = grid.shape
+    if starts is None:
+        starts = np.column_stack([rng.integers(0, n, restarts), rng.integers(0, m, restarts)])
+        starts[0] = problem.initial
+    position = np.array(starts, dtype=np.intp).reshape(-1, 2)
+    moves = np.array(list(problem.defined_actions.values()), dtype=np.intp)
+    value = grid[position[:, 0], position[:, 1]]
+    steps = np.zeros(len(position), dtype=np.int64)
+    active = np.arange(len(position))
+    while len(active):
+        here = position[active]
+        neighbors = here[:, None, :] + moves[None, :, :]
+        inside = ((neighbors[..., 0] >= 0) & (neighbors[..., 0] < n) &
+                  (neighbors[..., 1] >= 0) & (neighbors[..., 1] < m))
+        x = np.clip(neighbors[..., 0], 0, n - 1)
+        y = np.clip(neighbors[..., 1], 0, m - 1)
+        values = np.where(inside, grid[x, y], -np.inf)
+        best = values.max(axis=1)
+        ties = values == best[:, None]
+        choice = np.argmax(ties * rng.random(ties.shape), axis=1)
+        climbing = best > value[active]
+        active = active[climbing]
+        position[active] = neighbors[climbing, choice[climbing]]
+        value[active] = best[climbing]
+        steps[active] += 1
+    top = int(np.argmax(value))
+    runs = dict(start=np.array(starts).reshape(-1, 2), peak=position, value=value, steps=steps)
+    return tuple(int(i) for i in position[top]), runs
+
+
+class Schedule:
+    """A cooling schedule for simulated annealing: schedule(t) is the
+    temperature at step t, read from a table computed in advance for
+    t < limit, and 0 (which stops the search) after that. Subclasses build
+    the table with NumPy; schedules that adapt to the search also have an
+    update(accepted) method, called after every step."""
+
+    def __init__(self, table):
+        self.table = np.asarray(table, dtype=float)
+        self.limit = len(self.table)
+        self.temperatures = self.table.tolist()  # list indexing is faster than array indexing
+
+    def __call__(self, t):
+        return self.temperatures[t] if t < self.limit else 0
+
+
+class ExponentialSchedule(Schedule):
+    """T(t) = k * exp(-lam * t)."""
+
+    def __init__(self, k=20, lam=0.005, limit=100):
+        super().__init__(k * np.exp(-lam * np.arange(limit)))
+
+
+class LinearSchedule(Schedule):
+    """T falls in a straight line from k at t = 0 to 0 at t = limit."""
+
+    def __init__(self, k=20, limit=100):
+        super().__init__(k * (1 - np.arange(limit) / limit))
+
+
+class LogarithmicSchedule(Schedule):
+    """T(t) = k / log(t + 2), the slow schedule under which simulated annealing
+    provably converges to a global optimum (for k large enough)."""
+
+    def __init__(self, k=20, limit=100):
+        super().__init__(k / np.log(np.arange(limit) + 2))
+
+
+class AdaptiveSchedule(Schedule):
+    """A schedule that steers the acceptance rate rather than the temperature.
+    The table holds the target rate of accepted moves, falling exponentially
+    from start_rate to end_rate over limit steps. Every window steps the
+    temperature is multiplied by factor if more moves than the target were
+    accepted, and divided by it if fewer. The search starts at temperature k."""
+
+    def __init__(self, k=20, start_rate=0.5, end_rate=0.01, limit=100, window=50, factor=0.9):
+        super().__init__(np.geomspace(start_rate, end_rate, limit))
+        self.targets = self.temperatures
+        self.k = k
+        self.window = window
+        self.factor = factor
+        self.reset()
+
+    def reset(self):
+        self.T = self.k
+        self.t = self.accepted = 0
+
+    def __call__(self, t):
+        if t == 0:
+            self.reset()  # a new search
+        return self.T if t < self.limit else 0
+
+    def update(self, accepted):
+        self.t += 1
+        self.accepted += accepted
+        if self.t % self.window == 0:
+            target = self.targets[min(self.t, self.limit - 1)]
+            if self.accepted > target * self.window:
+                self.T *= self.factor
+            else:
+                self.T /= self.factor
+            self.accepted = 0
+
+
 def exp_schedule(k=20, lam=0.005, limit=100):
     """One possible schedule function for simulated annealing"""
-    return lambda t: (k * np.exp(-lam * t) if t < limit else 0)
+    return ExponentialSchedule(k, lam, limit)
+
+
+class RingBuffer:
+    """The last size states appended, with their values: a fixed block of
+    memory however long the search runs. Iterating gives (state, value)
+    pairs from the oldest to the newest."""
+
+    def __init__(self, size):
+        self.size = size
+        self.states = [None] * size
+        self.buffer = np.zeros(size)
+        self.count = 0  # number of appends so far
 
+    def append(self, state, value):
+        i = self.count % self.size
+        self.states[i] = state
+        self.buffer[i] = value
+        self.count += 1
 
+    def order(self):
+        """Indices of the stored entries, oldest first."""
+        if self.count <= self.size:
+            return range(self.count)
+        start = self.count % self.size
+        return itertools.chain(range(start, self.size), range(start))
+
+    def values(self):
+        """The stored values as an array, oldest first."""
+        return self.buffer[list(self.order())]
+
+    def __iter__(self):
+        return ((self.states[i], self.buffer[i]) for i in self.order())
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+
+def annealing_child(problem, node, action, state):
+    """The child of node by action, whose state is already known, without
+    calling problem.result again."""
+    return Node(state, node, action, problem.path_cost(node.path_cost, node.state, action, state))
+
+
+@budgeted
 def simulated_annealing(problem, schedule=exp_schedule()):
     """[Figure 4.5] CAUTION: This differs from the pseudocode as it
-    returns a state instead of a Node."""
-    current = Node(problem.initial)
+    returns a state instead of a Node.
+    Each step samples one neighbor with problem.random_action and judges it
+    by problem.delta_value, so no Node is built and no other neighbor is
+    looked at. Under a budget the moves made are kept as a chain of Nodes,
+    so the node charged is the real current one."""
+    current = problem.initial
+    budget = search_budget.get()
+    node = Node(current) if budget is not None else None
+    update = getattr(schedule, 'update', None)
     for t in range(sys.maxsize):
         T = schedule(t)
         if T == 0:
-            return current.state
-        neighbors = current.expand(problem)
-        if not neighbors:
-            return current.state
-        next_choice = random.choice(neighbors)
-        delta_e = problem.value(next_choice.state) - problem.value(current.state)
-        if delta_e > 0 or probability(np.exp(delta_e / T)):
-            current = next_choice
-
-
-def simulated_annealing_full(problem, schedule=exp_schedule()):
+            return current
+        if node is not None:
+            budget.charge(node)
+        action = problem.random_action(current)
+        if action is None:
+            return current
+        delta_e = problem.delta_value(current, action)
+        accepted = delta_e > 0 or random.random() < math.exp(delta_e / T)
+        if accepted:
+            current = problem.result(current, action)
+            if node is not None:
+                node = annealing_child(problem, node, action, current)
+        if update is not None:
+            update(accepted)
+
+
+@budgeted
+def simulated_annealing_full(problem, schedule=exp_schedule(), history=None):
     """ This version returns all the states encountered in reaching
-    the goal state."""
-    states = []
-    current = Node(problem.initial)
+    the goal state. With history=n it instead returns a RingBuffer of the
+    last n states and their values, so that long runs take constant memory.
+    As in simulated_annealing, a budget is charged with the real current Node."""
+    if history is None:
+        states = []
+        record = lambda state, value: states.append(state)
+    else:
+        states = RingBuffer(history)
+        record = states.append
+    current = problem.initial
+    value = problem.value(current) if history is not None else None
+    budget = search_budget.get()
+    node = Node(current) if budget is not None else None
+    update = getattr(schedule, 'update', None)
     for t in range(sys.maxsize):
-        states.append(current.state)
+        record(current, value)
         T = schedule(t)
         if T == 0:
             return states
-        neighbors = current.expand(problem)
-        if not neighbors:
-            return current.state
-        next_choice = random.choice(neighbors)
-        delta_e = problem.value(next_choice.state) - problem.value(current.state)
-        if delta_e > 0 or probability(np.exp(delta_e / T)):
-            current = next_choice
+        if node is not None:
+            budget.charge(node)
+        action = problem.random_action(current)
+        if action is None:
+            return current
+        delta_e = problem.delta_value(current, action)
+        accepted = delta_e > 0 or random.random() < math.exp(delta_e / T)
+        if accepted:
+            current = problem.result(current, action)
+            if node is not None:
+                node = annealing_child(problem, node, action, current)
+            if value is not None:
+                value += delta_e
+        if update is not None:
+            update(accepted)
+
+
+# The problem of the parallel_tempering worker processes, set once per process
+# by their initializer rather than sent with every task.
+tempering_problem = None
+
+
+def set_tempering_problem(problem):
+    global tempering_problem
+    tempering_problem = problem
+
+
+def anneal_at(state, T, steps, seed):
+    """Run steps Metropolis steps of tempering_problem at the fixed temperature
+    T from state. Return (state, value, best state, best value). It seeds
+    the worker's random module with seed, which problem.random_action draws
+    from too, so the same seed gives the same walk."""
+    problem = tempering_problem
+    random.seed(seed)
+    value = best_value = problem.value(state)
+    best = state
+    for _ in range(steps):
+        action = problem.random_action(state)
+        if action is None:
+            break
+        delta_e = problem.delta_value(state, action)
+        if delta_e >= 0 or random.random() < math.exp(delta_e / T):
+            state = problem.result(state, action)
+            value += delta_e
+            if value > best_value:
+                best, best_value = state, value
+    return state, value, best, best_value
+
+
+def parallel_tempering(problem, temperatures=None, rounds=100, steps=1000, max_workers=None, seed=None):
+    """Parallel tempering (replica exchange): one replica of the problem per
+    temperature, each a Metropolis walk at that fixed temperature, run side
+    by side in a process pool. After every round of steps moves, replicas
+    at neighboring temperatures swap states with probability
+    min(1, exp((v_j - v_i) * (1/T_i - 1/T_j))), so good states found by the
+    hot, exploring replicas sink to the cold, climbing ones. temperatures
+    defaults to 8 steps from 0.1 to 10. Returns the best state seen by any
+    replica, stopping early if it is a goal. The same seed gives the same
+    result. The problem must be picklable, and is sent once to each worker."""
+    temperatures = sorted(np.geomspace(0.1, 10, 8) if temperatures is None else temperatures)
+    rng = random.Random(seed)
+    states = [problem.initial] * len(temperatures)
+    values = [problem.value(problem.initial)] * len(temperatures)
+    best, best_value = problem.initial, values[0]
+    with ProcessPoolExecutor(max_workers, initializer=set_tempering_problem, initargs=(problem,)) as executor:
+        for _ in range(rounds):
+            futures = [executor.submit(anneal_at, state, T, steps, rng.getrandbits(64))
+                       for state, T in zip(states, temperatures)]
+            for i, future in enumerate(futures):
+                states[i], values[i], state, value = future.result()
+                if value > best_value:
+                    best, best_value = state, value
+            if problem.goal_test(best):
+                break
+            for i in range(len(temperatures) - 1):
+                j = i + 1
+                exponent = (values[j] - values[i]) * (1 / temperatures[i] - 1 / temperatures[j])
+                if exponent >= 0 or rng.random() < math.exp(exponent):
+                    states[i], states[j] = states[j], states[i]
+                    values[i], values[j] = values[j], values[i]
+    return best
 
 
 def and_or_graph_search(problem):
@@ -1011,31 +2390,199 @@ class LRTAStarAgent:
 # Genetic Algorithm
 
 
-def genetic_search(problem, ngen=1000, pmut=0.1, n=20):
+def genetic_search(problem, ngen=1000, pmut=0.1, n=20, gene_pool=None, f_thres=None, **kwargs):
     """Call genetic_algorithm on the appropriate parts of a problem.
     This requires the problem to have states that can mate and mutate,
-    plus a value method that scores states."""
-
-    # NOTE: This is not tested and might not work.
-    # TODO: Use this function to make Problems work with genetic_algorithm.
-
-    s = problem.initial_state
-    states = [problem.result(s, a) for a in problem.actions(s)]
+    plus a value method that scores states. The initial population is up to
+    n random neighbors of problem.initial, as lists of genes; the gene pool
+    defaults to every gene value found in them. Individuals are turned back
+    into states of the type of problem.initial (see as_state) to be scored,
+    and the best is returned that way. Other keyword arguments go to
+    genetic_algorithm."""
+    s = problem.initial
+    states = [list(problem.result(s, a)) for a in problem.actions(s)]
     random.shuffle(states)
-    return genetic_algorithm(states[:n], problem.value, ngen, pmut)
-
-
-def genetic_algorithm(population, fitness_fn, gene_pool=[0, 1], f_thres=None, ngen=1000, pmut=0.1):
-    """[Figure 4.8]"""
-    for i in range(ngen):
-        population = [mutate(recombine(*select(2, population, fitness_fn)), gene_pool, pmut)
-                      for i in range(len(population))]
-
-        fittest_individual = fitness_threshold(fitness_fn, f_thres, population)
-        if fittest_individual:
-            return fittest_individual
-
-    return max(population, key=fitness_fn)
+    states = states[:n]
+    if gene_pool is None:
+        gene_pool = list(dict.fromkeys(itertools.chain.from_iterable(states)))
+    fitness_fn = functools.partial(state_value, problem, type(s))
+    return as_state(type(s), genetic_algorithm(states, fitness_fn, gene_pool, f_thres, ngen, pmut, **kwargs))
+
+
+def as_state(kind, individual):
+    """The individual (a sequence of genes) as a state of type kind: joined
+    into a string for str, a tuple for tuple, and otherwise as it is."""
+    if kind is str:
+        return ''.join(individual)
+    if kind is tuple:
+        return tuple(individual)
+    return individual
+
+
+def state_value(problem, kind, individual):
+    """problem.value of the individual as a state of type kind; the fitness
+    function of genetic_search."""
+    return problem.value(as_state(kind, individual))
+
+
+class FitnessCache:
+    """A fitness function with an LRU cache of the last maxsize individuals
+    it scored, so that an individual met again, in the same generation or a
+    later one, is not scored again. Individuals are keyed by their bytes:
+    tobytes() for NumPy arrays, their pickle otherwise. evaluate scores a
+    whole population, optionally sending the individuals not in the cache
+    to an executor (such as a ProcessPoolExecutor) to be scored in parallel."""
+
+    def __init__(self, fitness_fn, maxsize=10000):
+        self.fitness_fn = fitness_fn
+        self.maxsize = maxsize
+        self.cache = collections.OrderedDict()
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def key(individual):
+        if isinstance(individual, np.ndarray):
+            return individual.tobytes()
+        return pickle.dumps(individual, pickle.HIGHEST_PROTOCOL)
+
+    def __call__(self, individual):
+        return self.evaluate([individual])[0]
+
+    def evaluate(self, population, executor=None):
+        """The list of the fitnesses of the individuals in population."""
+        keys = [self.key(individual) for individual in population]
+        found, missing = {}, {}
+        for key, individual in zip(keys, population):
+            if key in found or key in missing:
+                continue
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                found[key] = self.cache[key]
+            else:
+                missing[key] = individual
+        if missing:
+            if executor is None:
+                values = map(self.fitness_fn, missing.values())
+            else:
+                values = executor.map(self.fitness_fn, missing.values(), chunksize=max(1, len(missing) // 32))
+            for key, value in zip(missing, values):
+                found[key] = self.cache[key] = value
+            while len(self.cache) > self.maxsize:
+                self.cache.popitem(last=False)
+        self.misses += len(missing)
+        self.hits += len(keys) - len(missing)
+        return [found[key] for key in keys]
+
+
+def roulette_weights(fitnesses):
+    """Cumulative selection weights for fitnesses, shifted up so that none is
+    negative; None (choose uniformly) if they are all equal to the lowest."""
+    lowest = min(fitnesses)
+    cumulative = list(itertools.accumulate(f - lowest for f in fitnesses) if lowest < 0
+                      else itertools.accumulate(fitnesses))
+    return cumulative if cumulative[-1] > 0 else None
+
+
+def genetic_algorithm(population, fitness_fn, gene_pool=[0, 1], f_thres=None, ngen=1000, pmut=0.1,
+                      cache_size=10000, max_workers=None):
+    """[Figure 4.8]
+    The fitness of every individual is computed once per generation, through
+    a FitnessCache of cache_size individuals, and with max_workers the
+    individuals not in the cache are scored in a process pool (fitness_fn
+    must then be picklable). Fitnesses may be negative: selection then uses
+    them shifted so that the lowest is 0."""
+    cache = FitnessCache(fitness_fn, cache_size)
+    with ProcessPoolExecutor(max_workers) if max_workers else contextlib.nullcontext() as executor:
+        fitnesses = cache.evaluate(population, executor)
+        for i in range(ngen):
+            population = next_generation(population, fitnesses, gene_pool, pmut)
+            fitnesses = cache.evaluate(population, executor)
+            if f_thres and max(fitnesses) >= f_thres:
+                break
+    return population[max(range(len(population)), key=fitnesses.__getitem__)]
+
+
+def next_generation(population, fitnesses, gene_pool, pmut, recombine_fn=None, mutate_fn=None):
+    """Breed a new population of the same size: each child is the mutation of
+    the recombination of two parents chosen by roulette on fitnesses.
+    recombine_fn and mutate_fn default to recombine and mutate."""
+    recombine_fn = recombine_fn or recombine
+    mutate_fn = mutate_fn or mutate
+    weights = roulette_weights(fitnesses)
+    return [mutate_fn(recombine_fn(*random.choices(population, cum_weights=weights, k=2)), gene_pool, pmut)
+            for _ in range(len(population))]
+
+
+def island_worker(index, population, fitness_fn, gene_pool, f_thres, ngen, pmut, interval, migrants,
+                  recombine_fn, mutate_fn, inbox, outbox, done, results, seed):
+    """One island of island_genetic_algorithm, in its own process."""
+    try:
+        random.seed(None if seed is None else '{}/{}'.format(seed, index))
+        cache = FitnessCache(fitness_fn)
+        fitnesses = cache.evaluate(population)
+        for generation in range(1, ngen + 1):
+            population = next_generation(population, fitnesses, gene_pool, pmut, recombine_fn, mutate_fn)
+            fitnesses = cache.evaluate(population)
+            if f_thres and max(fitnesses) >= f_thres:
+                done.set()
+            if done.is_set():
+                break
+            if generation % interval == 0:
+                ranked = sorted(range(len(population)), key=fitnesses.__getitem__)
+                outbox.put([population[i] for i in ranked[-migrants:]])
+                arrivals = []
+                with contextlib.suppress(queue.Empty):
+                    while True:
+                        arrivals.extend(inbox.get_nowait())
+                # The newcomers take the places of the least fit.
+                for i, individual in zip(ranked, arrivals[-migrants:]):
+                    population[i] = individual
+                    fitnesses[i] = cache(individual)
+        best = max(range(len(population)), key=fitnesses.__getitem__)
+        results.put((index, fitnesses[best], population[best], generation, None))
+    except Exception as e:
+        results.put((index, None, None, None, e))
+
+
+def island_genetic_algorithm(populations, fitness_fn, gene_pool=[0, 1], f_thres=None, ngen=1000, pmut=0.1,
+                             interval=10, migrants=2, recombine_fn=None, mutate_fn=None, seed=None):
+    """The island model of the genetic algorithm: each of the populations
+    (made, for example, by init_population) evolves as in genetic_algorithm
+    on an island of its own, a separate process. Every interval generations
+    each island sends copies of its migrants fittest individuals to the next
+    island, around a ring, and the individuals that have arrived from the
+    one before replace its least fit. Migration is asynchronous: an island
+    doesn't wait for the others. All islands stop when one of them reaches
+    f_thres. recombine_fn and mutate_fn default to recombine and mutate
+    (recombine_uniform also fits). fitness_fn and the individuals must be
+    picklable. Returns the fittest individual of all the islands."""
+    k = len(populations)
+    queues = [multiprocessing.Queue() for _ in range(k)]
+    results = multiprocessing.Queue()
+    done = multiprocessing.Event()
+    processes = [multiprocessing.Process(target=island_worker,
+                                         args=(i, list(populations[i]), fitness_fn, gene_pool, f_thres, ngen, pmut,
+                                               interval, migrants, recombine_fn, mutate_fn,
+                                               queues[i], queues[(i + 1) % k], done, results, seed),
+                                         daemon=True)
+                 for i in range(k)]
+    for process in processes:
+        process.start()
+    try:
+        best = None
+        for _ in range(k):
+            _, fitness, individual, _, error = results.get()
+            if error is not None:
+                raise error
+            if best is None or fitness > best[0]:
+                best = (fitness, individual)
+        return best[1]
+    finally:
+        done.set()
+        for process in processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
 
 
 def fitness_threshold(fitness_fn, f_thres, population):
@@ -1083,7 +2630,9 @@ def recombine_uniform(x, y):
         ix = indexes[i]
         result[ix] = x[ix] if i < n / 2 else y[ix]
 
-    return ''.join(str(r) for r in result)
+    if isinstance(x, str):
+        return ''.join(str(r) for r in result)
+    return result
 
 
 def mutate(x, gene_pool, pmut):
@@ -1099,6 +2648,71 @@ def mutate(x, gene_pool, pmut):
     return x[:c] + [new_gene] + x[c + 1:]
 
 
+def genetic_algorithm_array(population, fitness_fn, gene_pool=[0, 1], f_thres=None, ngen=1000, pmut=0.1,
+                            uniform=False, vectorized=False, seed=None, cache_size=10000, max_workers=None):
+    """genetic_algorithm with the population held as a 2-D NumPy array, one
+    individual per row, and each generation made in a few array operations:
+    roulette selection of all the parents at once with a cumulative sum of
+    the fitnesses and searchsorted, crossover as a mask choosing each gene
+    from one parent or the other (one crossover point as in recombine, or
+    half the genes as in recombine_uniform if uniform), and mutation of one
+    random gene in a pmut fraction of the children, as in mutate.
+    Fitness is computed once per individual per generation: fitness_fn is
+    called on each row, or, if vectorized, once on the whole population to
+    return an array of fitnesses (see nqueens_fitness). Row by row, the
+    fitnesses go through a FitnessCache of cache_size individuals, and with
+    max_workers the rows not in the cache are scored in a process pool.
+    Returns the fittest individual as a list."""
+    rng = np.random.default_rng(seed)
+    genes = np.asarray(gene_pool)
+    population = np.asarray(population)
+    n, length = population.shape
+    cache = FitnessCache(fitness_fn, cache_size)
+    pool = max_workers and not vectorized
+    with ProcessPoolExecutor(max_workers) if pool else contextlib.nullcontext() as executor:
+        if vectorized:
+            evaluate = fitness_fn
+        else:
+            evaluate = lambda population: np.array(cache.evaluate(population, executor), dtype=float)
+        fitness = evaluate(population)
+        for _ in range(ngen):
+            cumulative = np.cumsum(fitness - min(fitness.min(), 0))
+            if cumulative[-1] > 0:
+                parents = np.searchsorted(cumulative, rng.random(2 * n) * cumulative[-1], side='right')
+                parents = np.minimum(parents, n - 1)
+            else:
+                parents = rng.integers(0, n, 2 * n)
+            x, y = population[parents[:n]], population[parents[n:]]
+            if uniform:
+                mask = rng.random((n, length)).argsort(axis=1) < length / 2
+            else:
+                mask = np.arange(length) < rng.integers(0, length, n)[:, None]
+            population = np.where(mask, x, y)
+            mutants = np.flatnonzero(rng.random(n) < pmut)
+            population[mutants, rng.integers(0, length, len(mutants))] = \
+                genes[rng.integers(0, len(genes), len(mutants))]
+            fitness = evaluate(population)
+            if f_thres is not None and fitness.max() >= f_thres:
+                break
+    return population[np.argmax(fitness)].tolist()
+
+
+def nqueens_fitness(population):
+    """The number of pairs of queens not attacking each other, for every row
+    of population (a 2-D array where population[i, c] is the row of the
+    queen in column c), computed for all rows at once. For a single
+    individual, the count is returned as an int. The goal of N-Queens is a
+    fitness of N * (N - 1) / 2."""
+    queens = np.asarray(population)
+    rows = np.atleast_2d(queens)
+    n = rows.shape[1]
+    i, j = np.triu_indices(n, 1)
+    difference = np.abs(rows[:, i] - rows[:, j])
+    attacking = (difference == 0) | (difference == j - i)
+    fitness = len(i) - attacking.sum(axis=1)
+    return fitness if queens.ndim == 2 else int(fitness[0])
+
+
 # _____________________________________________________________________________
 # The remainder of this file implements examples for the search algorithms.
 
@@ -1123,6 +2737,8 @@ class Graph:
     def __init__(self, graph_dict=None, directed=True):
         self.graph_dict = graph_dict or {}
         self.directed = directed
+        self.apsp = None
+        self.location_index = None
         if not directed:
             self.make_undirected()
 
@@ -1132,6 +2748,15 @@ class Graph:
             for (b, dist) in self.graph_dict[a].items():
                 self.connect1(b, a, dist)
 
+    def copy(self):
+        """A plain Graph with the same links and locations, which can be
+        changed without changing this one."""
+        graph = Graph({a: dict(links) for a, links in self.graph_dict.items()})
+        graph.directed = self.directed
+        if hasattr(self, 'locations'):
+            graph.locations = dict(self.locations)
+        return graph
+
     def connect(self, A, B, distance=1):
         """Add a link from A and B of given distance, and also add the inverse
         link if the graph is undirected."""
@@ -1142,6 +2767,8 @@ class Graph:
     def connect1(self, A, B, distance):
         """Add a link from A to B of given distance, in one direction only."""
         self.graph_dict.setdefault(A, {})[B] = distance
+        self.apsp = None
+        self.location_index = None
 
     def get(self, a, b=None):
         """Return a link distance or a dict of {node: distance} entries.
@@ -1160,6 +2787,164 @@ class Graph:
         nodes = s1.union(s2)
         return list(nodes)
 
+    def nearest_node(self, point):
+        """Return the node whose location is closest to the (x, y) point, or
+        None if the graph has no locations. The spatial index is built on the
+        first call and rebuilt after a connect or when self.locations is
+        replaced or changes size; after moving a node in place, as in
+        g.locations['A'] = (x, y), set g.location_index = None."""
+        locations = getattr(self, 'locations', None) or {}
+        index = self.location_index
+        if index is None or index.locations is not locations or len(index) != len(locations):
+            index = self.location_index = GridIndex(locations)
+        return index.nearest(point)
+
+    def shortest_paths(self):
+        """Return the AllPairsShortestPaths of this graph. It is computed on
+        the first call and cached until the next connect."""
+        if self.apsp is None:
+            self.apsp = AllPairsShortestPaths(self)
+        return self.apsp
+
+
+class GridIndex:
+    """A spatial index over a dict of {key: (x, y)} locations. The plane is
+    cut into square cells holding about two points each, so a nearest
+    neighbor query only looks at the cells in a few rings around the point
+    instead of at every location. Ties are broken in favour of the key that
+    was added first, like min() over the keys in insertion order would."""
+
+    def __init__(self, locations=None, cell_size=None):
+        self.locations = locations if locations is not None else {}
+        self.order = {}
+        self.cells = collections.defaultdict(list)
+        self.bounds = None  # (min cx, min cy, max cx, max cy) of occupied cells
+        if cell_size is None:
+            cell_size = 1
+            if len(self.locations) > 1:
+                xs = [x for x, _ in self.locations.values()]
+                ys = [y for _, y in self.locations.values()]
+                area = max(max(xs) - min(xs), 1) * max(max(ys) - min(ys), 1)
+                cell_size = math.sqrt(2 * area / len(self.locations))
+        self.cell_size = cell_size
+        for key, xy in self.locations.items():
+            self.insert(key, xy)
+
+    def cell(self, xy):
+        return math.floor(xy[0] / self.cell_size), math.floor(xy[1] / self.cell_size)
+
+    def insert(self, key, xy):
+        """Index key at location xy. Adding it to .locations is up to the caller."""
+        self.order.setdefault(key, len(self.order))
+        cx, cy = self.cell(xy)
+        self.cells[cx, cy].append((key, xy))
+        if self.bounds is None:
+            self.bounds = (cx, cy, cx, cy)
+        else:
+            x0, y0, x1, y1 = self.bounds
+            self.bounds = (min(x0, cx), min(y0, cy), max(x1, cx), max(y1, cy))
+
+    def nearest(self, point, exclude=None):
+        """Return the key closest to point for which exclude(key) is false,
+        or None if there is no such key."""
+        if self.bounds is None:
+            return None
+        x, y = point
+        cx, cy = self.cell(point)
+        x0, y0, x1, y1 = self.bounds
+        best, best_rank = None, (np.inf, 0)
+        for r in range(max(cx - x0, x1 - cx, cy - y0, y1 - cy) + 1):
+            # Points in ring r and beyond are at least (r - 1) cells away.
+            if best_rank[0] < (r - 1) * self.cell_size:
+                break
+            for cell in self.ring(cx, cy, r):
+                for key, (kx, ky) in self.cells.get(cell, ()):
+                    rank = (math.hypot(kx - x, ky - y), self.order[key])
+                    if rank < best_rank and not (exclude and exclude(key)):
+                        best, best_rank = key, rank
+        return best
+
+    @staticmethod
+    def ring(cx, cy, r):
+        """The cells at Chebyshev distance r from cell (cx, cy)."""
+        if r == 0:
+            yield cx, cy
+            return
+        for i in range(-r, r + 1):
+            yield cx + i, cy - r
+            yield cx + i, cy + r
+        for j in range(-r + 1, r):
+            yield cx - r, cy + j
+            yield cx + r, cy + j
+
+    def __len__(self):
+        return len(self.order)
+
+
+class AllPairsShortestPaths:
+    """Distance and next-hop matrices for every pair of nodes of a Graph,
+    computed once with a vectorized Floyd-Warshall. Meant for small maps such
+    as australia_map or the country maps, where the n x n matrices are cheap.
+    Afterwards .distance(a, b) is a single lookup and .path(a, b) takes time
+    proportional to the length of the path. Edge lengths must be numbers."""
+
+    def __init__(self, graph):
+        self.nodes = graph.nodes()
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+        n = len(self.nodes)
+        dist = np.full((n, n), np.inf)
+        hop = np.full((n, n), -1, dtype=np.intp)
+        for a, links in graph.graph_dict.items():
+            i = self.index[a]
+            for b, d in links.items():
+                j = self.index[b]
+                if d < dist[i, j]:
+                    dist[i, j] = d
+                    hop[i, j] = j
+        diagonal = np.arange(n)
+        dist[diagonal, diagonal] = 0
+        hop[diagonal, diagonal] = diagonal
+        for k in range(n):
+            via_k = dist[:, k, None] + dist[None, k, :]
+            shorter = via_k < dist
+            dist = np.where(shorter, via_k, dist)
+            hop = np.where(shorter, hop[:, k, None], hop)
+        self.dist = dist
+        self.hop = hop
+
+    def distance(self, a, b):
+        """Length of a shortest path from a to b, or inf if b is unreachable."""
+        if a == b:
+            return 0
+        if a not in self.index or b not in self.index:
+            return np.inf
+        return self.dist[self.index[a], self.index[b]].item()
+
+    def path(self, a, b):
+        """Return the list of nodes on a shortest path from a to b (both
+        included), or None if b is unreachable from a."""
+        if a == b:
+            return [a]
+        if self.distance(a, b) == np.inf:
+            return None
+        i, j = self.index[a], self.index[b]
+        path = [a]
+        while i != j:
+            i = self.hop[i, j]
+            path.append(self.nodes[i])
+        return path
+
+    def solve(self, problem):
+        """Return the goal Node of a shortest path for a GraphProblem, in the
+        same form as the search functions return it, or None."""
+        path = self.path(problem.initial, problem.goal)
+        if path is None:
+            return None
+        node = Node(path[0])
+        for state in path[1:]:
+            node = node.child_node(problem, state)
+        return node
+
 
 def UndirectedGraph(graph_dict=None):
     """Build a Graph where every edge (including future ones) goes both ways."""
@@ -1179,645 +2964,141 @@ def RandomGraph(nodes=list(range(10)), min_links=2, width=400, height=300,
     # Build the cities
     for node in nodes:
         g.locations[node] = (random.randrange(width), random.randrange(height))
+    index = GridIndex(g.locations)
     # Build roads from each city to at least min_links nearest neighbors.
     for i in range(min_links):
         for node in nodes:
-            if len(g.get(node)) < min_links:
+            links = g.get(node)
+            if len(links) < min_links:
                 here = g.locations[node]
-
-                def distance_to_node(n):
-                    if n is node or g.get(node, n):
-                        return np.inf
-                    return distance(g.locations[n], here)
-
-                neighbor = min(nodes, key=distance_to_node)
+                neighbor = index.nearest(here, exclude=lambda n: n == node or n in links)
+                if neighbor is None:
+                    continue
                 d = distance(g.locations[neighbor], here) * curvature()
                 g.connect(node, neighbor, int(d))
+    g.location_index = index
     return g
 
 
 
 
-def switch_country_map(country = "Lithuania"):
-    global romania_map , romania_map_start , romania_map_goal
+# Country road maps used in the lab. The data lives in map_data/<country>.json
+# with the edges already symmetrized, and a country is only read from disk the
+# first time it is asked for.
 
+COUNTRY_MAPS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'map_data')
+COUNTRIES = ('Lithuania', 'Romania', 'India', 'Russia', 'Ukraine')
 
-    if maps.romania_map_start is None:
-        if country == "Lithuania":
-            maps.romania_map_start = "Druskininkai"
-        if country == "Romania":
-            maps.romania_map_start = "Arad"
-        if country == "India":
-            maps.romania_map_start = "Mumbai"
-        if country == "Russia":
-            maps.romania_map_start = "Moscow"
-        if country == "Ukraine":
-            maps.romania_map_start = "Kyiv"
 
-    if maps.romania_map_goal is None:
-        if country == "Lithuania":
-            maps.romania_map_goal = "Nida"
-        if country == "Romania":
-            maps.romania_map_goal = "Bucharest"
-        if country == "India":
-            maps.romania_map_goal = "Delhi"
-        if country == "Russia":
-            maps.romania_map_goal = "Belgorod"
-        if country == "Ukraine":
-            maps.romania_map_goal = "Dnipro"
+@functools.lru_cache(maxsize=None)
+def load_country_map(country):
+    """Return (graph, start, goal) for one of the COUNTRIES. The map file is
+    read on the first call only; later calls return the same cached Graph,
+    so callers that change the graph must work on a copy()."""
+    if country not in COUNTRIES:
+        raise ValueError('Unknown country map: {}'.format(country))
+    path = os.path.join(COUNTRY_MAPS_DIR, country.lower() + '.json')
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    # Stored edges already go both ways, so there is no need for make_undirected.
+    graph = Graph(data['graph'])
+    graph.directed = False
+    graph.locations = {city: tuple(xy) for city, xy in data['locations'].items()}
+    return graph, data['start'], data['goal']
+
+
+class FrozenGraph(Graph):
+    """A read-only copy of a Graph that can be shared between threads.
+    Links and locations are exposed through read-only mappings, .get never
+    inserts missing nodes, connect raises TypeError, and the all-pairs
+    shortest paths are computed up front so that no lazy state is left."""
+
+    no_links = types.MappingProxyType({})
+
+    def __init__(self, graph):
+        self.graph_dict = types.MappingProxyType(
+            {a: types.MappingProxyType(dict(links)) for a, links in graph.graph_dict.items()})
+        self.directed = graph.directed
+        self.locations = types.MappingProxyType(dict(getattr(graph, 'locations', {})))
+        self.location_index = GridIndex(self.locations)
+        self.apsp = AllPairsShortestPaths(self)
+
+    def connect1(self, A, B, distance):
+        raise TypeError('A FrozenGraph cannot be modified')
+
+    def get(self, a, b=None):
+        links = self.graph_dict.get(a, FrozenGraph.no_links)
+        if b is None:
+            return links
+        else:
+            return links.get(b)
 
+    def __reduce__(self):
+        # Mapping proxies do not pickle, so send a plain Graph and refreeze it.
+        return FrozenGraph, (self.copy(),)
+
+
+class MapRegistry:
+    """Thread-safe registry of country maps keyed by country name. Each
+    country is loaded once, frozen and then shared, so any number of threads
+    can search different (or the same) countries at the same time:
+        registry = MapRegistry()
+        graph, start, goal = registry.get('Romania')
+    """
+
+    def __init__(self, loader=load_country_map):
+        """loader(country) must return (graph, start, goal)."""
+        self.loader = loader
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def get(self, country):
+        """Return (graph, start, goal) for country, where graph is a FrozenGraph."""
+        entry = self.entries.get(country)
+        if entry is None:
+            with self.lock:
+                entry = self.entries.get(country)
+                if entry is None:
+                    graph, start, goal = self.loader(country)
+                    entry = self.entries[country] = (FrozenGraph(graph), start, goal)
+        return entry
+
+    def graph(self, country):
+        return self.get(country)[0]
+
+    def problem(self, country, start=None, goal=None):
+        """A GraphProblem on the country's map, from its default start to its
+        default goal unless others are given."""
+        graph, default_start, default_goal = self.get(country)
+        return GraphProblem(start or default_start, goal or default_goal, graph)
+
+    def __contains__(self, country):
+        return country in self.entries
+
+
+country_maps = MapRegistry()
+
+
+def search_countries(searcher=uniform_cost_search, countries=COUNTRIES, registry=country_maps, max_workers=None):
+    """Run searcher on the default problem of every country concurrently.
+    Return a dict of {country: result of searcher}."""
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {country: executor.submit(searcher, registry.problem(country))
+                   for country in countries}
+        return {country: future.result() for country, future in futures.items()}
+
+
+def switch_country_map(country="Lithuania"):
+    """Fill whichever of maps.romania_map, maps.romania_map_start and
+    maps.romania_map_goal are still None from the map of the given country.
+    maps.romania_map gets a copy, so changing it leaves the cached map alone."""
+    graph, start, goal = load_country_map(country)
+    if maps.romania_map_start is None:
+        maps.romania_map_start = start
+    if maps.romania_map_goal is None:
+        maps.romania_map_goal = goal
     if maps.romania_map is None:
-        if country == "Lithuania":
-
-            maps.romania_map = UndirectedGraph(dict(
-                Druskininkai=dict(Lazdijai=37, Alytus=42, Varėna=44),
-                Lazdijai=dict(Kalvarija=27, Marijampolė=37),
-                Nida=dict(Klaipėda=45, Palanga=68, Šilutė=300),
-                Kalvarija=dict(Marijampolė=17, Lazdijai=27),
-                Kelmė=dict(Telšiai=57, Kuršėnai=41, Tauragė=58, Šilalė=50, Jurbarkas=62, Raseiniai=30, Šiauliai=40,
-                           Radviliškis=42),
-                Telšiai=dict(Šilalė=54, Kelmė=57, Kuršėnai=42, Mažeikiai=36, Rietavas=35, Plungė=25),
-                Šilalė=dict(Kelmė=50, Tauragė=27, Rietavas=30, Telšiai=54),
-                Pagėgiai=dict(Jurbarkas=57, Tauragė=29, Šilalė=44),
-                Vilkaviškis=dict(Kalvarija=30, Marijampolė=24, Šakiai=32),
-                Jurbarkas=dict(Tauragė=36, Kelmė=62, Raseiniai=40, Šakiai=21),
-                Klaipėda=dict(Palanga=23, Kretinga=21, Gargždai=16),  # Kaunas=220  ,Kaunas=100
-                Palanga=dict(Kretinga=11, Klaipėda=23),
-                Ignalina=dict(Švenčionys=23, Pabradė=46, Visaginas=33, Zarasai=43, Utena=39),
-                Švenčionys=dict(Visaginas=54, Pabradė=29, Ignalina=23),
-                Visaginas=dict(Ignalina=33, Zarasai=18),
-                Pabradė=dict(Švenčionys=29, Vilnius=45, Molėtai=35, Ignalina=46, Utena=58),
-                Šalčininkai=dict(Pabradė=78, Vilnius=41, Varėna=53),
-                Kuršėnai=dict(Telšiai=42, Naujoji_Akmenė=35, Mažeikiai=50, Kelmė=41, Šiauliai=25),
-                Mažeikiai=dict(Kuršėnai=50, Telšiai=36, Skuodas=49, Plungė=53),
-                Naujoji_Akmenė=dict(Mažeikiai=33, Joniškis=46, Šiauliai=51, Kuršėnai=35),
-                Tauragė=dict(Šilalė=27, Jurbarkas=36, Kelmė=58),
-                Šilutė=dict(Klaipėda=45, Gargždai=39, Šilalė=46, Rietavas=50),
-                Gargždai=dict(Klaipėda=16, Plungė=37, Kretinga=23, Rietavas=33),
-                Zarasai=dict(Ignalina=43, Rokiškis=48, Utena=47),
-                Raseiniai=dict(Kelmė=30, Jurbarkas=40, Kėdainiai=54, Radviliškis=53, Domeikava=68, Šakiai=47),
-                Plungė=dict(Mažeikiai=53, Telšiai=25, Skuodas=43, Kretinga=37, Gargždai=37, Rietavas=21),
-                Skuodas=dict(Plungė=43, Palanga=48, Kretinga=45),
-                Kretinga=dict(Skuodas=45, Plungė=37, Gargždai=23, Palanga=11, Klaipėda=21),
-                Marijampolė=dict(Kazlų_Rūda=23, Kalvarija=17, Lazdijai=37, Prienai=38),
-                Kazlų_Rūda=dict(Šakiai=36, Marijampolė=23, Prienai=31, Garliava=25, Domeikava=36),
-                Šakiai=dict(Raseiniai=47, Jurbarkas=21, Kazlų_Rūda=36, Domeikava=55),
-                Radviliškis=dict(Raseiniai=53, Kelmė=42, Kėdainiai=63, Šiauliai=20, Panevėžys=51, Pakruojis=27),
-                Kėdainiai=dict(Radviliškis=63, Panevėžys=55, Ukmergė=49, Jonava=30, Domeikava=35, Raseiniai=54),
-                Pasvalys=dict(Biržai=26, Pakruojis=35, Joniškis=52, Kupiškis=43, Panevėžys=37),
-                Biržai=dict(Joniškis=70, Kupiškis=42, Pasvalys=26),
-                Joniškis=dict(Pasvalys=52, Biržai=70, Naujoji_Akmenė=46, Pakruojis=32, Šiauliai=39),
-                Vilnius=dict(Lentvaris=15, Pabradė=45, Molėtai=61, Širvintos=45),  # , Kaunas=110, Kaunas=70
-                Lentvaris=dict(Vilnius=15, Trakai=7),
-                Molėtai=dict(Vilnius=61, Utena=31, Pabradė=35, Anykščiai=38, Ukmergė=42, Širvintos=36),
-                Rietavas=dict(Plungė=21, Gargždai=33, Šilalė=30, Telšiai=35),
-                Likiškiai=dict(Alytus=36, Prienai=26, Birštonas=23),
-                Panevėžys=dict(Radviliškis=51, Ukmergė=56, Kėdainiai=55, Pasvalys=37, Pakruojis=42, Anykščiai=51, Kupiškis=39),
-                Šiauliai=dict(Kuršėnai=25, Kelmė=40, Joniškis=39, Naujoji_Akmenė=51, Pakruojis=34, Radviliškis=20),
-                Anykščiai=dict(Utena=31, Molėtai=38, Ukmergė=37, Panevėžys=51, Kupiškis=34, Rokiškis=55),
-                Utena=dict(Rokiškis=51, Anykščiai=31, Zarasai=47, Ignalina=39, Pabradė=58, Molėtai=31),
-                Rokiškis=dict(Anykščiai=55, Utena=51, Biržai=57, Kupiškis=40),
-                Alytus=dict(Birštonas=22, Elektrėnai=58, Varėna=39),
-                Birštonas=dict(Prienai=6, Kaišiadorys=40, Garliava=25, Kaunas=33, Elektrėnai=45),
-                Prienai=dict(Marijampolė=38, Kazlų_Rūda=31, Birštonas=6, Garliava=20),
-                Grigiškės=dict(Trakai=11, Vilnius=12, Elektrėnai=29),
-                Ukmergė=dict(Molėtai=42, Anykščiai=37, Panevėžys=56, Širvintos=27, Kaišiadorys=48, Kėdainiai=49, Jonava=36),
-                Pakruojis=dict(Panevėžys=42, Radviliškis=27, Pasvalys=35, Joniškis=32, Šiauliai=34),
-                Kupiškis=dict(Panevėžys=39, Rokiškis=40, Anykščiai=34, Biržai=42, Pasvalys=43),
-                Trakai=dict(Lentvaris=7, Varėna=52, Elektrėnai=24),
-                Varėna=dict(Trakai=52, Elektrėnai=64),
-                Kaišiadorys=dict(Kaunas=34, Širvintos=36, Jonava=25, Ukmergė=48, Elektrėnai=15, Birštonas=40),
-                Kaunas=dict(Birštonas=33, Garliava=10, Kaišiadorys=34, Jonava=29, Domeikava=7, Klaipėda=150),  # , Klaipėda=200
-                Širvintos=dict(Molėtai=36, Vilnius=45, Ukmergė=27, Kaišiadorys=36, Elektrėnai=33),
-                Garliava=dict(Prienai=20, Birštonas=25, Kazlų_Rūda=25, Domeikava=16, Kaunas=10),
-                Jonava=dict(Kaunas=29, Ukmergė=36, Kaišiadorys=25, Kėdainiai=30, Domeikava=25),
-                Elektrėnai=dict(Širvintos=33, Varėna=64, Trakai=24, Kaišiadorys=15, Birštonas=45),
-                Domeikava=dict(Jonava=25, Kaunas=7, Kėdainiai=35, Kazlų_Rūda=36, Garliava=16, Šakiai=55, Raseiniai=68)
-            ))
-
-            maps.romania_map.locations = dict(
-                Vilnius=(1261, 258),
-                Kaunas=(863, 343),
-                Klaipėda=(40, 658),
-                Šiauliai=(681, 744),
-                Panevėžys=(990, 665),
-                Alytus=(897, 148),
-                Marijampolė=(692, 209),
-                Mažeikiai=(392, 894),
-                Utena=(1355, 577),
-                Jonava=(965, 410),
-                Kėdainiai=(872, 493),
-                Telšiai=(366, 766),
-                Tauragė=(378, 480),
-                Ukmergė=(1103, 486),
-                Visaginas=(1600, 616),
-                Plungė=(248, 740),
-                Kretinga=(71, 731),
-                Šilutė=(140, 519),
-                Palanga=(17, 740),
-                Radviliškis=(750, 694),
-                Rokiškis=(1348, 758),
-                Druskininkai=(874, 0),
-                Elektrėnai=(1077, 299),
-                Biržai=(1103, 851),
-                Jurbarkas=(521, 412),
-                Vilkaviškis=(597, 252),
-                Joniškis=(770, 868),
-                Anykščiai=(1209, 591),
-                Varėna=(1051, 74),
-                Prienai=(865, 239),
-                Kelmė=(568, 629),
-                Naujoji_Akmenė=(553, 900),
-                Šalčininkai=(1289, 113),
-                Pasvalys=(1001, 796),
-                Zarasai=(1545, 667),
-                Kupiškis=(1167, 707),
-                Kazlų_Rūda=(731, 284),
-                Molėtai=(1300, 473),
-                Skuodas=(155, 877),
-                Šakiai=(601, 365),
-                Šilalė=(345, 574),
-                Trakai=(1157, 239),
-                Pakruojis=(840, 765),
-                Švenčionys=(1518, 434),
-                Kalvarija=(655, 153),
-                Lazdijai=(740, 82),
-                Rietavas=(271, 665),
-                Nida=(0, 501),
-                Birštonas=(891, 228),
-                Širvintos=(1160, 400),
-                Pagėgiai=(257, 434),
-                Kaišiadorys=(1020, 329),
-                Raseiniai=(624, 530),
-                Ignalina=(1519, 515),
-                Gargždai=(116, 655),
-                Kuršėnai=(569, 774),
-                Grigiškės=(1202, 258),
-                Likiškiai=(881, 146),
-                Lentvaris=(1192, 243),
-                Garliava=(843, 310),
-                Pabradė=(1403, 375),
-                Domeikava=(858, 369)
-            )
-        if country == "Romania":
-            maps.romania_map = UndirectedGraph(dict(
-                Arad=dict(Zerind=75, Sibiu=140, Timisoara=118),
-                Bucharest=dict(Urziceni=85, Pitesti=101, Giurgiu=90, Fagaras=211),
-                Craiova=dict(Drobeta=120, Rimnicu=146, Pitesti=138),
-                Drobeta=dict(Mehadia=75),
-                Eforie=dict(Hirsova=86),
-                Fagaras=dict(Sibiu=99),
-                Hirsova=dict(Urziceni=98),
-                Iasi=dict(Vaslui=92, Neamt=87),
-                Lugoj=dict(Timisoara=111, Mehadia=70),
-                Oradea=dict(Zerind=71, Sibiu=151),
-                Pitesti=dict(Rimnicu=97),
-                Rimnicu=dict(Sibiu=80),
-                Urziceni=dict(Vaslui=142)))
-            maps.romania_map.locations = dict(
-                Arad=(91, 492), Bucharest=(400, 327), Craiova=(253, 288),
-                Drobeta=(165, 299), Eforie=(562, 293), Fagaras=(305, 449),
-                Giurgiu=(375, 270), Hirsova=(534, 350), Iasi=(473, 506),
-                Lugoj=(165, 379), Mehadia=(168, 339), Neamt=(406, 537),
-                Oradea=(131, 571), Pitesti=(320, 368), Rimnicu=(233, 410),
-                Sibiu=(207, 457), Timisoara=(94, 410), Urziceni=(456, 350),
-                Vaslui=(509, 444), Zerind=(108, 531))
-
-        if country == "India":
-            maps.romania_map = UndirectedGraph(dict(
-                Gorakhpur=dict(Guwāhāti=836, Lucknow=240, Patna=218, Vārānasi=164, Bareilly=428, Allahābād=210,
-                               Mirzāpur=195),
-                Guwāhāti=dict(Kolkāta=526, Dhanbād=597, Hāora=529, Patna=663, Gorakhpur=836),
-                Chennai=dict(Madurai=422, Vishākhapatnam=611, Trichinopoly=304, Hyderābād=513, Bhubaneshwar=993,
-                             Bangalore=290, Salem=278, Bezwāda=383, Guntūr=358),
-                Kolhāpur=dict(Hubli=176, Shimoga=340, Pune=206, Solāpur=208, Kochi=780, Mumbai=300),
-                Hubli=dict(Solāpur=270, Shimoga=167, Kolhāpur=176),
-                Solāpur=dict(Kolhāpur=208, Hubli=270, Shimoga=419, Pune=236, Bangalore=552, Aurangābād=253, Bhopāl=639,
-                             Hyderābād=274),
-                Shimoga=dict(Solāpur=419, Hubli=167, Bangalore=242, Mysore=214, Kochi=446, Kolhāpur=340),
-                Bangalore=dict(Solāpur=552, Shimoga=242, Hyderābād=496, Chennai=290, Salem=160, Mysore=126,
-                               Coimbatore=230),
-                Dhanbād=dict(Hāora=236, Patna=240, Guwāhāti=597, Rānchi=122, Jamshedpur=113),
-                Hāora=dict(Guwāhāti=529, Kolkāta=3, Bhubaneshwar=364, Dhanbād=236, Jamshedpur=221),
-                Kolkāta=dict(Guwāhāti=526, Hāora=3, Bhubaneshwar=367),
-                Bezwāda=dict(Chennai=383, Vishākhapatnam=317, Raipur=535, Bhilai=529, Guntūr=29, Warangal=194),
-                Vishākhapatnam=dict(Bezwāda=317, Raipur=427, Chennai=611, Bilāspur=509, Bhubaneshwar=385),
-                Raipur=dict(Bezwāda=535, Bhilai=21, Vishākhapatnam=427, Bilāspur=108),
-                Lucknow=dict(Allahābād=179, Cawnpore=74, Gorakhpur=240, Bareilly=226),
-                Allahābād=dict(Gorakhpur=210, Cawnpore=189, Lucknow=179, Mirzāpur=80, Bilāspur=367, Jabalpur=319),
-                Pune=dict(Mumbai=120, Kolhāpur=206, Kalyān=109, Nāsik=164, Solāpur=236, Mālegaon=237, Aurangābād=215),
-                Mumbai=dict(Kolhāpur=300, Pune=120, Rājkot=418, Sūrat=232, Kalyān=35, Thāne=14),
-                Trichinopoly=dict(Madurai=118, Salem=108, Chennai=304),
-                Madurai=dict(Chennai=422, Trichinopoly=118, Salem=192, Coimbatore=174),
-                Mysore=dict(Bangalore=126, Shimoga=214, Coimbatore=149, Kochi=263),
-                Bhilai=dict(Jabalpur=265, Bezwāda=529, Nāgpur=243, Warangal=408, Raipur=21, Bilāspur=119),
-                Jabalpur=dict(Nāgpur=240, Allahābād=319, Cawnpore=369, Bilāspur=241, Bhilai=265, Bhopāl=257,
-                              Gwalior=381),
-                Nāgpur=dict(Bhilai=243, Warangal=357, Hyderābād=426, Jabalpur=240, Bhopāl=289),
-                Hyderābād=dict(Solāpur=274, Bangalore=496, Warangal=137, Chennai=513, Guntūr=241, Bhopāl=663,
-                               Nāgpur=426),
-                Patna=dict(Rānchi=251, Dhanbād=240, Guwāhāti=663, Gorakhpur=218, Vārānasi=216),
-                Rānchi=dict(Dhanbād=122, Patna=251, Jamshedpur=106, Bhubaneshwar=347, Vārānasi=320, Bilāspur=365),
-                Vārānasi=dict(Patna=216, Rānchi=320, Gorakhpur=164, Mirzāpur=47, Bilāspur=366),
-                Bhubaneshwar=dict(Kolkāta=367, Vishākhapatnam=385, Chennai=993, Jamshedpur=284, Hāora=364, Bilāspur=447,
-                                  Rānchi=347),
-                Cawnpore=dict(Jabalpur=369, Allahābād=189, Lucknow=74, Gwalior=214, Bareilly=228),
-                Bareilly=dict(Gorakhpur=428, Srīnagar=772, Lucknow=226, Cawnpore=228, Gwalior=267, Morādābād=83,
-                              Āgra=191, Alīgarh=141),
-                Srīnagar=dict(Bareilly=772, Morādābād=693, Sahāranpur=526, Chandīgarh=417, Amritsar=274, Jalandhar=315,
-                              Jodhpur=883),
-                Morādābād=dict(Bareilly=83, Sahāranpur=170, Srīnagar=693, Meerut=103, Alīgarh=125),
-                Kalyān=dict(Mumbai=35, Pune=109, Nāsik=105, Thāne=22, Bhiwandi=11),
-                Nāsik=dict(Kalyān=105, Bhiwandi=108, Sūrat=163, Pune=164, Vadodara=262, Mālegaon=100),
-                Aurangābād=dict(Pune=215, Indore=320, Mālegaon=109, Bhopāl=432, Solāpur=253),
-                Salem=dict(Madurai=192, Chennai=278, Trichinopoly=108, Bangalore=160, Coimbatore=149),
-                Kochi=dict(Mysore=263, Shimoga=446, Kolhāpur=780, Coimbatore=137, Thiruvananthapuram=176),
-                Thiruvananthapuram=dict(Kochi=176, Madurai=206, Coimbatore=278),
-                Warangal=dict(Bhilai=408, Bezwāda=194, Nāgpur=357, Guntūr=207, Hyderābād=137),
-                Guntūr=dict(Chennai=358, Hyderābād=241, Bezwāda=29, Warangal=207),
-                Mirzāpur=dict(Gorakhpur=195, Vārānasi=47, Bilāspur=338, Allahābād=80),
-                Jamshedpur=dict(Dhanbād=113, Rānchi=106, Hāora=221, Bhubaneshwar=284),
-                Sahāranpur=dict(Meerut=109, Morādābād=170, Srīnagar=526, Ghāziābād=144, Chandīgarh=112, Delhi=147),
-                Meerut=dict(Morādābād=103, Alīgarh=128, Ghāziābād=45, Sahāranpur=109),
-                Chandīgarh=dict(Sahāranpur=112, Srīnagar=417, Jalandhar=132, Ludhiāna=92, Delhi=233, New_Delhi=239),
-                Amritsar=dict(Jalandhar=74, Ludhiāna=122, Jaipur=532, Jodhpur=619, Srīnagar=274),
-                Jalandhar=dict(Srīnagar=315, Chandīgarh=132, Ludhiāna=53, Amritsar=74),
-                Bhiwandi=dict(Kalyān=11, Nāsik=108, Thāne=17, Sūrat=209),
-                Gwalior=dict(Jabalpur=381, Cawnpore=214, Jaipur=244, Kota=263, Bhopāl=338, Āgra=107, Bareilly=267),
-                Jaipur=dict(Kota=193, Ludhiāna=443, Jodhpur=290, Amritsar=532, Gwalior=244, Āgra=214, Farīdābād=221,
-                            New_Delhi=230),
-                Kota=dict(Gwalior=263, Indore=273, Bhopāl=268, Jaipur=193, Vadodara=417, Jodhpur=306),
-                Sūrat=dict(Bhiwandi=209, Rājkot=244, Mumbai=232, Thāne=221, Nāsik=163, Ahmedabad=208, Vadodara=131),
-                Rājkot=dict(Mumbai=418, Jodhpur=498, Ahmedabad=200, Sūrat=244),
-                Mālegaon=dict(Aurangābād=109, Nāsik=100, Pune=237, Indore=276, Vadodara=239),
-                Indore=dict(Mālegaon=276, Bhopāl=171, Aurangābād=320, Kota=273, Vadodara=275),
-                Coimbatore=dict(Bangalore=230, Salem=149, Madurai=174, Mysore=149, Thiruvananthapuram=278, Kochi=137),
-                Bilāspur=dict(Vārānasi=366, Rānchi=365, Mirzāpur=338, Raipur=108, Bhilai=119, Vishākhapatnam=509,
-                              Bhubaneshwar=447, Allahābād=367, Jabalpur=241),
-                Thāne=dict(Mumbai=14, Kalyān=22, Sūrat=221, Bhiwandi=17),
-                Bhopāl=dict(Kota=268, Gwalior=338, Indore=171, Nāgpur=289, Jabalpur=257, Aurangābād=432, Solāpur=639,
-                            Hyderābād=663),
-                Ludhiāna=dict(Chandīgarh=92, Jalandhar=53, Amritsar=122, Jaipur=443, New_Delhi=286),
-                Jodhpur=dict(Kota=306, Jaipur=290, Srīnagar=883, Amritsar=619, Vadodara=444, Rājkot=498, Ahmedabad=365),
-                Alīgarh=dict(Morādābād=125, Bareilly=141, Farīdābād=97, Āgra=78, Meerut=128, Ghāziābād=108),
-                Āgra=dict(Jaipur=214, Farīdābād=156, Alīgarh=78, Gwalior=107, Bareilly=191),
-                Farīdābād=dict(Jaipur=221, Āgra=156, New_Delhi=22, Alīgarh=97, Delhi=27, Ghāziābād=27),
-                New_Delhi=dict(Jaipur=230, Ludhiāna=286, Chandīgarh=239, Delhi=5, Farīdābād=22),
-                Vadodara=dict(Indore=275, Kota=417, Mālegaon=239, Sūrat=131, Nāsik=262, Jodhpur=444, Ahmedabad=103),
-                Ghāziābād=dict(Alīgarh=108, Farīdābād=27, Meerut=45, Sahāranpur=144, Delhi=19),
-                Delhi=dict(Sahāranpur=147, Chandīgarh=233, Ghāziābād=19, New_Delhi=5, Farīdābād=27),
-                Ahmedabad=dict(Jodhpur=365, Vadodara=103, Rājkot=200, Sūrat=208)
-            ))
-
-            maps.romania_map.locations = dict(
-                Delhi=(589, 843),
-                Mumbai=(284, 450),
-                Kolkāta=(1372, 593),
-                Bangalore=(615, 200),
-                Chennai=(803, 204),
-                Hyderābād=(677, 380),
-                Pune=(353, 427),
-                Ahmedabad=(263, 612),
-                Allahābād=(914, 711),
-                Sūrat=(281, 536),
-                Lucknow=(851, 769),
-                Jaipur=(494, 772),
-                Cawnpore=(807, 753),
-                Mirzāpur=(965, 699),
-                Nāgpur=(720, 535),
-                Ghāziābād=(603, 843),
-                Vadodara=(307, 582),
-                Vishākhapatnam=(1017, 395),
-                Indore=(493, 600),
-                Thāne=(290, 454),
-                Bhopāl=(603, 621),
-                Patna=(1145, 718),
-                Bilāspur=(926, 576),
-                Ludhiāna=(493, 935),
-                Āgra=(645, 782),
-                Kalyān=(304, 457),
-                Madurai=(652, 75),
-                Jamshedpur=(1218, 603),
-                Nāsik=(348, 488),
-                Farīdābād=(596, 834),
-                Aurangābād=(456, 483),
-                Rājkot=(138, 582),
-                Meerut=(623, 857),
-                Jabalpur=(779, 618),
-                Dhanbād=(1236, 644),
-                Vārānasi=(996, 706),
-                Srīnagar=(419, 1066),
-                Amritsar=(424, 965),
-                Alīgarh=(649, 811),
-                Guwāhāti=(1609, 741),
-                Bhilai=(885, 538),
-                Hāora=(1369, 594),
-                Rānchi=(1159, 626),
-                Gwalior=(657, 743),
-                Bezwāda=(827, 345),
-                Chandīgarh=(559, 928),
-                Jodhpur=(295, 746),
-                Mysore=(549, 172),
-                Raipur=(899, 539),
-                Kota=(491, 700),
-                New_Delhi=(588, 841),
-                Bareilly=(743, 831),
-                Coimbatore=(571, 119),
-                Solāpur=(497, 392),
-                Trichinopoly=(692, 112),
-                Hubli=(442, 298),
-                Jalandhar=(474, 952),
-                Bhubaneshwar=(1193, 499),
-                Morādābād=(697, 851),
-                Kolhāpur=(379, 353),
-                Thiruvananthapuram=(566, 16),
-                Bhiwandi=(297, 459),
-                Sahāranpur=(612, 897),
-                Warangal=(756, 405),
-                Salem=(655, 145),
-                Mālegaon=(401, 511),
-                Kochi=(523, 76),
-                Gorakhpur=(1021, 765),
-                Shimoga=(473, 238),
-                Guntūr=(816, 336)
-            )
-        if country == "Russia":
-            maps.romania_map = UndirectedGraph(dict(
-                Arkhangelsk=dict(Kirov=817, Vologda=593, Saint_Petersburg=734),
-                Kirov=dict(Perm=390, Arkhangelsk=817, Yaroslavl=585, Vologda=563, Izhevsk=287, Ivanovo=542),
-                Vladivostok=dict(Khabarovsk=645),
-                Perm=dict(Nizhniy_Tagil=219, Kirov=390, Yekaterinburg=292, Izhevsk=222),
-                Nizhniy_Tagil=dict(Surgut=841, Tyumen=342, Yekaterinburg=126, Perm=219),
-                Surgut=dict(Tomsk=845, Tyumen=639, Nizhniy_Tagil=841),
-                Tomsk=dict(Krasnoyarsk=491, Kemerovo=146, Novosibirsk=205, Omsk=742, Surgut=845),
-                Astrakhan=dict(Makhachkala=374, Orenburg=793, Volzhskiy=365, Volgograd=372, Rostov=639, Stavropol=489),
-                Krasnoyarsk=dict(Novokuznetsk=445, Irkutsk=850, Tomsk=491, Kemerovo=433),
-                Irkutsk=dict(Krasnoyarsk=850, Ulan_Ude=231, Chita=627),
-                Ulan_Ude=dict(Chita=404, Irkutsk=231),
-                Chita=dict(Irkutsk=627, Ulan_Ude=404,Khabarovsk=1100),
-                Orenburg=dict(Astrakhan=793, Volzhskiy=804, Saratov=627, Samara=372, Magnitogorsk=320),
-                Novokuznetsk=dict(Barnaul=224, Krasnoyarsk=445, Novosibirsk=307, Kemerovo=188),
-                Volzhskiy=dict(Astrakhan=365, Volgograd=20, Belgorod=620, Saratov=318, Orenburg=804),
-                Volgograd=dict(Astrakhan=372, Volzhskiy=20, Rostov=392, Belgorod=606),
-                Belgorod=dict(Volgograd=606, Rostov=438, Volzhskiy=620, Saratov=664, Kursk=129, Voronezh=217),
-                Rostov=dict(Astrakhan=639, Volgograd=392, Belgorod=438, Stavropol=299, Krasnodar=251),
-                Kemerovo=dict(Krasnoyarsk=433, Novokuznetsk=188, Tomsk=146, Novosibirsk=202),
-                Vologda=dict(Kirov=563, Cherepovets=113, Yaroslavl=177, Arkhangelsk=593, Saint_Petersburg=545),
-                Yaroslavl=dict(Tver=250, Cherepovets=202, Vologda=177, Ivanovo=97, Kirov=585),
-                Tver=dict(Ivanovo=308, Yaroslavl=250, Saint_Petersburg=473, Cherepovets=278, Kaliningrad=990,
-                          Vladimir=286, Smolensk=334, Balashikha=171, Moscow=161),
-                Ivanovo=dict(Yaroslavl=97, Kirov=542, Tver=308, Vladimir=103, Izhevsk=740, Nizhniy_Novgorod=198),
-                Cherepovets=dict(Tver=278, Yaroslavl=202, Saint_Petersburg=437, Vologda=113),
-                Saint_Petersburg=dict(Kaliningrad=826, Tver=473, Vologda=545, Cherepovets=437),
-                Kaliningrad=dict(Tver=990, Smolensk=740, Bryansk=919),
-                Sochi=dict(Krasnodar=171, Makhachkala=631, Stavropol=242),
-                Krasnodar=dict(Rostov=251, Stavropol=235, Sochi=171),
-                Novosibirsk=dict(Kemerovo=202, Barnaul=194, Novokuznetsk=307, Tomsk=205, Omsk=607),
-                Barnaul=dict(Novokuznetsk=224, Novosibirsk=194, Omsk=699),
-                Saratov=dict(Belgorod=664, Voronezh=468, Volzhskiy=318, Lipetsk=453, Penza=197, Samara=334,
-                             Orenburg=627),
-                Voronezh=dict(Belgorod=217, Saratov=468, Lipetsk=108, Kursk=208),
-                Lipetsk=dict(Voronezh=108, Kursk=252, Saratov=453, Bryansk=357, Penza=367, Tula=219),
-                Kursk=dict(Voronezh=208, Belgorod=129, Lipetsk=252, Bryansk=208),
-                Smolensk=dict(Tver=334, Bryansk=228, Kaliningrad=740, Kaluga=272, Moscow=369),
-                Vladimir=dict(Ivanovo=103, Ryazan=173, Nizhniy_Novgorod=223, Cheboksary=423, Balashikha=157, Tver=286),
-                Penza=dict(Lipetsk=367, Samara=340, Saratov=197, Tolyatti=295, Ulyanovsk=253, Ryazan=380, Tula=498),
-                Ryazan=dict(Cheboksary=504, Moscow=183, Penza=380, Tula=143, Kaluga=222, Vladimir=173, Balashikha=172,
-                            Kazan=609, Ulyanovsk=559),
-                Cheboksary=dict(Vladimir=423, Nizhniy_Novgorod=201, Izhevsk=374, Kazan=122, Ryazan=504),
-                Stavropol=dict(Astrakhan=489, Rostov=299, Makhachkala=496, Sochi=242, Krasnodar=235),
-                Makhachkala=dict(Astrakhan=374, Stavropol=496),
-                Omsk=dict(Novosibirsk=607, Barnaul=699, Tomsk=742, Magnitogorsk=948, Chelyabinsk=762, Tyumen=544),
-                Bryansk=dict(Kursk=208, Kaluga=189, Kaliningrad=919, Smolensk=228, Lipetsk=357, Tula=238),
-                Kaluga=dict(Smolensk=272, Moscow=160, Ryazan=222, Tula=94, Bryansk=189),
-                Nizhniy_Novgorod=dict(Ivanovo=198, Vladimir=223, Cheboksary=201, Izhevsk=566),
-                Moscow=dict(Smolensk=369, Kaluga=160, Tver=161, Ryazan=183, Balashikha=21),
-                Samara=dict(Tolyatti=59, Penza=340, Saratov=334, Magnitogorsk=592, Orenburg=372),
-                Tolyatti=dict(Penza=295, Ulyanovsk=112, Samara=59, Ufa=446, Magnitogorsk=636),
-                Tyumen=dict(Omsk=544, Surgut=639, Nizhniy_Tagil=342, Chelyabinsk=339, Yekaterinburg=300),
-                Ulyanovsk=dict(Penza=253, Ryazan=559, Tolyatti=112, Kazan=170, Ufa=491, Naberezhnyye_Chelny=295),
-                Tula=dict(Penza=498, Lipetsk=219, Bryansk=238, Ryazan=143, Kaluga=94),
-                Balashikha=dict(Ryazan=172, Moscow=21, Vladimir=157, Tver=171),
-                Magnitogorsk=dict(Tolyatti=636, Samara=592, Orenburg=320, Ufa=250, Omsk=948, Chelyabinsk=249),
-                Ufa=dict(Ulyanovsk=491, Tolyatti=446, Naberezhnyye_Chelny=253, Chelyabinsk=351, Magnitogorsk=250),
-                Izhevsk=dict(Perm=222, Nizhniy_Novgorod=566, Kirov=287, Ivanovo=740, Yekaterinburg=449, Cheboksary=374,
-                             Naberezhnyye_Chelny=139, Kazan=278),
-                Yekaterinburg=dict(Tyumen=300, Nizhniy_Tagil=126, Perm=292, Izhevsk=449, Naberezhnyye_Chelny=526,
-                                   Chelyabinsk=193),
-                Kazan=dict(Izhevsk=278, Cheboksary=122, Ryazan=609, Naberezhnyye_Chelny=201, Ulyanovsk=170),
-                Naberezhnyye_Chelny=dict(Yekaterinburg=526, Izhevsk=139, Ulyanovsk=295, Kazan=201, Ufa=253,
-                                         Chelyabinsk=574),
-                Chelyabinsk=dict(Naberezhnyye_Chelny=574, Yekaterinburg=193, Magnitogorsk=249, Ufa=351, Omsk=762,
-                                 Tyumen=339)
-            ))
-
-            maps.romania_map.locations = dict(
-                Moscow=(968, 384),
-                Saint_Petersburg=(935, 497),
-                Novosibirsk=(1170, 365),
-                Yekaterinburg=(1070, 413),
-                Nizhniy_Novgorod=(996, 400),
-                Kazan=(1019, 385),
-                Chelyabinsk=(1074, 368),
-                Omsk=(1127, 363),
-                Samara=(1024, 315),
-                Rostov=(977, 155),
-                Ufa=(1050, 356),
-                Krasnoyarsk=(1214, 391),
-                Voronezh=(975, 274),
-                Perm=(1051, 445),
-                Volgograd=(999, 194),
-                Krasnodar=(974, 96),
-                Saratov=(1005, 271),
-                Tyumen=(1092, 422),
-                Tolyatti=(1020, 324),
-                Izhevsk=(1037, 414),
-                Barnaul=(1174, 320),
-                Ulyanovsk=(1016, 345),
-                Irkutsk=(1265, 291),
-                Khabarovsk=(1402, 188),
-                Yaroslavl=(978, 434),
-                Vladivostok=(1388, 44),
-                Makhachkala=(1012, 40),
-                Tomsk=(1179, 404),
-                Orenburg=(1046, 277),
-                Kemerovo=(1184, 373),
-                Novokuznetsk=(1189, 330),
-                Ryazan=(977, 354),
-                Astrakhan=(1014, 131),
-                Naberezhnyye_Chelny=(1033, 383),
-                Penza=(1001, 315),
-                Lipetsk=(977, 300),
-                Kirov=(1021, 461),
-                Cheboksary=(1011, 394),
-                Tula=(968, 342),
-                Kaliningrad=(892, 356),
-                Balashikha=(969, 385),
-                Kursk=(961, 276),
-                Stavropol=(987, 96),
-                Ulan_Ude=(1280, 278),
-                Tver=(960, 414),
-                Magnitogorsk=(1063, 320),
-                Sochi=(977, 57),
-                Ivanovo=(983, 418),
-                Bryansk=(953, 317),
-                Belgorod=(963, 245),
-                Surgut=(1128, 532),
-                Vladimir=(980, 394),
-                Nizhniy_Tagil=(1067, 442),
-                Arkhangelsk=(981, 621),
-                Chita=(1306, 284),
-                Kaluga=(962, 351),
-                Smolensk=(943, 358),
-                Volzhskiy=(1000, 197),
-                Cherepovets=(969, 475),
-                Vologda=(978, 477)
-            )
-
-        if country == "Ukraine":
-            maps.romania_map = UndirectedGraph(dict(
-                Luhansk=dict(Khrustalnyi=58, Sievierodonetsk=74, Alchevsk=41, Chuhuiv=237, Sumy=415),
-                Khrustalnyi=dict(Rovenky=31, Luhansk=58, Alchevsk=39, Mariupol=151, Khartsyzk=59),
-                Rovenky=dict(Luhansk=55, Khrustalnyi=31, Mariupol=171),
-                Chernivtsi=dict(Chornomorsk=419, Kamianets_Podilskyi=64, Mukacheve=238, Ternopil=143,
-                                Ivano_Frankivsk=114),
-                Chornomorsk=dict(Kamianets_Podilskyi=404, Chernivtsi=419, Mukacheve=643, Sevastopol=293,
-                                 Yevpatoriia=242, Kherson=153, Odesa=20),
-                Kamianets_Podilskyi=dict(Chernivtsi=64, Ternopil=121, Chornomorsk=404, Odesa=396, Vinnytsia=147,
-                                         Khmelnytskyi=87),
-                Ternopil=dict(Chernivtsi=143, Rivne=125, Ivano_Frankivsk=96, Lviv=116, Lutsk=132, Chervonohrad=133,
-                              Kamianets_Podilskyi=121, Khmelnytskyi=102),
-                Alchevsk=dict(Luhansk=41, Khrustalnyi=39, Khartsyzk=68, Sievierodonetsk=58, Horlivka=54),
-                Sievierodonetsk=dict(Alchevsk=58, Luhansk=74, Horlivka=74, Sloviansk=63, Chuhuiv=163),
-                Mukacheve=dict(Chornomorsk=643, Drohobych=116, Sevastopol=930, Chernivtsi=238, Stryi=122,
-                               Ivano_Frankivsk=156),
-                Drohobych=dict(Uzhhorod=119, Chervonohrad=126, Lviv=66, Stryi=27, Mukacheve=116),
-                Uzhhorod=dict(Mukacheve=36, Drohobych=119),
-                Sevastopol=dict(Chornomorsk=293, Yevpatoriia=68, Kerch=245, Simferopol=59),
-                Rivne=dict(Lutsk=66, Chernihiv=365, Novohrad_Volynskyi=97, Khmelnytskyi=143, Ternopil=125),
-                Lutsk=dict(Ternopil=132, Rivne=66, Chervonohrad=87),
-                Chernihiv=dict(Lutsk=424, Rivne=365, Novohrad_Volynskyi=275, Brovary=114, Bucha=128),
-                Novohrad_Volynskyi=dict(Chernihiv=275, Vinnytsia=162, Khmelnytskyi=137, Rivne=97, Bucha=183,
-                                        Zhytomyr=81),
-                Ivano_Frankivsk=dict(Chernivtsi=114, Mukacheve=156, Ternopil=96, Lviv=113, Stryi=72),
-                Lviv=dict(Ivano_Frankivsk=113, Ternopil=116, Chervonohrad=61, Drohobych=66, Stryi=67),
-                Kherson=dict(Yevpatoriia=169, Chornomorsk=153, Nikopol=169, Melitopol=212, Kryvyi_Rih=152, Odesa=143,
-                             Mykolaiv=58),
-                Yevpatoriia=dict(Melitopol=238, Chornomorsk=242, Kherson=169, Simferopol=64, Sevastopol=68),
-                Melitopol=dict(Kherson=212, Nikopol=112, Simferopol=231, Yevpatoriia=238, Zaporizhzhia=113,
-                               Berdiansk=108, Kerch=186),
-                Nikopol=dict(Kryvyi_Rih=84, Kherson=169, Melitopol=112, Kamianske=105, Zaporizhzhia=65),
-                Kryvyi_Rih=dict(Kherson=152, Kremenchuk=130, Mykolaiv=145, Kropyvnytskyi=104, Kamianske=115,
-                                Nikopol=84),
-                Konotop=dict(Myrhorod=144, Cherkasy=215, Chernihiv=135, Brovary=187),
-                Myrhorod=dict(Sumy=134, Poltava=81, Kremenchuk=99, Konotop=144, Cherkasy=125),
-                Sumy=dict(Konotop=117, Myrhorod=134, Chuhuiv=178, Poltava=149, Kharkiv=142),
-                Chervonohrad=dict(Ternopil=133, Lviv=61, Uzhhorod=240, Drohobych=126),
-                Stryi=dict(Lviv=67, Ivano_Frankivsk=72, Drohobych=27, Mukacheve=122),
-                Poltava=dict(Sumy=149, Myrhorod=81, Kamianske=118, Kremenchuk=99, Kharkiv=128, Dnipro=127,
-                             Pavlohrad=150),
-                Khartsyzk=dict(Khrustalnyi=59, Alchevsk=68, Mariupol=109, Donetsk=25, Horlivka=33, Makiivka=14),
-                Simferopol=dict(Kerch=190, Melitopol=231, Sevastopol=59, Yevpatoriia=64),
-                Kerch=dict(Melitopol=186, Simferopol=190, Rovenky=376, Berdiansk=159, Mariupol=216),
-                Zaporizhzhia=dict(Nikopol=65, Dnipro=70, Kamianske=84, Pavlohrad=93, Berdiansk=172, Melitopol=113),
-                Kremenchuk=dict(Kropyvnytskyi=105, Poltava=99, Myrhorod=99, Cherkasy=107, Kamianske=107,
-                                Kryvyi_Rih=130),
-                Kropyvnytskyi=dict(Kryvyi_Rih=104, Uman=152, Mykolaiv=172, Cherkasy=104, Kremenchuk=105),
-                Mykolaiv=dict(Kropyvnytskyi=172, Kherson=58, Kryvyi_Rih=145, Uman=238, Odesa=110),
-                Uman=dict(Mykolaiv=238, Kropyvnytskyi=152, Odesa=255, Vinnytsia=140, Cherkasy=154, Bila_Tserkva=116),
-                Cherkasy=dict(Myrhorod=125, Uman=154, Kremenchuk=107, Kropyvnytskyi=104, Bila_Tserkva=145, Konotop=215,
-                              Brovary=149),
-                Vinnytsia=dict(Zhytomyr=116, Odesa=349, Kamianets_Podilskyi=147, Khmelnytskyi=106,
-                               Novohrad_Volynskyi=162, Uman=140, Bila_Tserkva=137),
-                Zhytomyr=dict(Novohrad_Volynskyi=81, Bucha=116, Bila_Tserkva=116, Vinnytsia=116),
-                Chuhuiv=dict(Sievierodonetsk=163, Luhansk=237, Sumy=178, Kharkiv=36, Sloviansk=127, Pavlohrad=157,
-                             Kramatorsk=139),
-                Horlivka=dict(Alchevsk=54, Khartsyzk=33, Sievierodonetsk=74, Myrnohrad=61, Kramatorsk=58, Sloviansk=68,
-                              Makiivka=32, Donetsk=41),
-                Mariupol=dict(Rovenky=171, Khrustalnyi=151, Kerch=216, Donetsk=99, Khartsyzk=109, Myrnohrad=132,
-                              Berdiansk=72),
-                Kamianske=dict(Dnipro=31, Poltava=118, Kremenchuk=107, Kryvyi_Rih=115, Zaporizhzhia=84, Nikopol=105),
-                Dnipro=dict(Poltava=127, Kamianske=31, Zaporizhzhia=70, Pavlohrad=61),
-                Odesa=dict(Mykolaiv=110, Uman=255, Chornomorsk=20, Kherson=143, Kamianets_Podilskyi=396, Vinnytsia=349),
-                Khmelnytskyi=dict(Kamianets_Podilskyi=87, Vinnytsia=106, Ternopil=102, Novohrad_Volynskyi=137,
-                                  Rivne=143),
-                Kharkiv=dict(Sumy=142, Chuhuiv=36, Pavlohrad=166, Poltava=128),
-                Pavlohrad=dict(Dnipro=61, Chuhuiv=157, Poltava=150, Kharkiv=166, Berdiansk=207, Zaporizhzhia=93,
-                               Myrnohrad=105, Kramatorsk=125),
-                Sloviansk=dict(Horlivka=68, Sievierodonetsk=63, Kramatorsk=17, Chuhuiv=127),
-                Donetsk=dict(Horlivka=41, Myrnohrad=51, Mariupol=99, Khartsyzk=25, Makiivka=12),
-                Myrnohrad=dict(Donetsk=51, Mariupol=132, Berdiansk=175, Pavlohrad=105, Horlivka=61, Kramatorsk=51),
-                Berdiansk=dict(Mariupol=72, Myrnohrad=175, Pavlohrad=207, Zaporizhzhia=172, Melitopol=108, Kerch=159),
-                Bucha=dict(Chernihiv=128, Novohrad_Volynskyi=183, Bila_Tserkva=83, Zhytomyr=116, Brovary=39, Kyiv=23),
-                Bila_Tserkva=dict(Uman=116, Kyiv=78, Bucha=83, Vinnytsia=137, Zhytomyr=116, Cherkasy=145, Brovary=92),
-                Kyiv=dict(Bucha=23, Brovary=20, Bila_Tserkva=78),
-                Brovary=dict(Konotop=187, Cherkasy=149, Chernihiv=114, Bucha=39, Bila_Tserkva=92, Kyiv=20),
-                Kramatorsk=dict(Myrnohrad=51, Horlivka=58, Pavlohrad=125, Chuhuiv=139, Sloviansk=17),
-                Makiivka=dict(Khartsyzk=14, Donetsk=12, Horlivka=32)
-            ))
-
-            maps.romania_map.locations = dict(
-                Kyiv=(759, 699),
-                Kharkiv=(1280, 646),
-                Odesa=(778, 237),
-                Dnipro=(1171, 468),
-                Donetsk=(1423, 415),
-                Zaporizhzhia=(1180, 395),
-                Lviv=(167, 628),
-                Kryvyi_Rih=(1016, 403),
-                Sevastopol=(1034, 19),
-                Mykolaiv=(894, 294),
-                Mariupol=(1402, 313),
-                Luhansk=(1563, 482),
-                Vinnytsia=(568, 555),
-                Simferopol=(1085, 59),
-                Makiivka=(1438, 420),
-                Poltava=(1128, 597),
-                Chernihiv=(829, 820),
-                Kherson=(949, 255),
-                Cherkasy=(899, 582),
-                Khmelnytskyi=(438, 579),
-                Zhytomyr=(589, 676),
-                Chernivtsi=(340, 448),
-                Sumy=(1149, 752),
-                Horlivka=(1450, 453),
-                Rivne=(369, 718),
-                Ivano_Frankivsk=(229, 521),
-                Kamianske=(1132, 473),
-                Kropyvnytskyi=(918, 473),
-                Ternopil=(310, 596),
-                Lutsk=(285, 733),
-                Kremenchuk=(1024, 539),
-                Bila_Tserkva=(722, 623),
-                Kramatorsk=(1401, 498),
-                Melitopol=(1201, 278),
-                Sievierodonetsk=(1485, 524),
-                Kerch=(1302, 105),
-                Drohobych=(118, 571),
-                Khrustalnyi=(1528, 428),
-                Uzhhorod=(8, 487),
-                Berdiansk=(1330, 270),
-                Sloviansk=(1407, 515),
-                Nikopol=(1109, 365),
-                Pavlohrad=(1247, 474),
-                Yevpatoriia=(1018, 89),
-                Alchevsk=(1514, 468),
-                Brovary=(783, 706),
-                Konotop=(1004, 790),
-                Kamianets_Podilskyi=(399, 493),
-                Mukacheve=(46, 465),
-                Uman=(731, 501),
-                Chervonohrad=(185, 691),
-                Khartsyzk=(1455, 418),
-                Stryi=(150, 559),
-                Chornomorsk=(771, 217),
-                Novohrad_Volynskyi=(495, 714),
-                Myrnohrad=(1374, 449),
-                Rovenky=(1566, 424),
-                Myrhorod=(1041, 642),
-                Bucha=(733, 710),
-                Chuhuiv=(1320, 627)
-            )
+        maps.romania_map = graph.copy()
 
 
 """ [Figure 4.9]
@@ -1904,6 +3185,11 @@ class GraphProblem(Problem):
 
         return m
 
+    def h_exact(self, node):
+        """Perfect heuristic: the true distance from a node's state to goal,
+        read from the graph's all-pairs shortest path cache."""
+        return self.graph.shortest_paths().distance(node.state, self.goal)
+
     def h(self, node):
         """h function is straight-line distance from a node's state to goal."""
         locs = getattr(self.graph, 'locations', None)
@@ -1995,6 +3281,67 @@ class NQueensProblem(Problem):
         return num_conflicts
 
 
+class NQueensLocalSearchProblem(Problem):
+    """The complete-state formulation of N-Queens, for local search. A state
+    has one queen in every column: state[c] is the row of the queen in
+    column c. An action (c, r) moves the queen of column c to row r. The
+    value of a state is minus the number of pairs of queens attacking each
+    other, so a goal has value 0. delta_value takes O(1), from counts of the
+    queens on every row and diagonal of the state."""
+
+    def __init__(self, N, initial=None):
+        if initial is None:
+            initial = tuple(random.randrange(N) for _ in range(N))
+        super().__init__(tuple(initial))
+        self.N = N
+        self.counted = None  # the state whose line counts are in self.counts
+
+    def actions(self, state):
+        return [(col, row) for col in range(self.N) for row in range(self.N) if row != state[col]]
+
+    def result(self, state, action):
+        col, row = action
+        new = list(state)
+        new[col] = row
+        return tuple(new)
+
+    def random_action(self, state):
+        if self.N < 2:
+            return None
+        col = random.randrange(self.N)
+        row = random.randrange(self.N - 1)
+        return col, row + (row >= state[col])
+
+    def line_counts(self, state):
+        """The number of queens on each row, \\ diagonal and / diagonal."""
+        if state is not self.counted:
+            N = self.N
+            rows, down, up = [0] * N, [0] * (2 * N - 1), [0] * (2 * N - 1)
+            for col, row in enumerate(state):
+                rows[row] += 1
+                down[row - col + N - 1] += 1
+                up[row + col] += 1
+            self.counted, self.counts = state, (rows, down, up)
+        return self.counts
+
+    def value(self, state):
+        return -sum(k * (k - 1) // 2 for counts in self.line_counts(state) for k in counts)
+
+    def delta_value(self, state, action):
+        col, new = action
+        old = state[col]
+        N = self.N
+        rows, down, up = self.line_counts(state)
+        # The queen attacks k - 1 others on each of its lines now, and would
+        # attack all the queens on the new lines.
+        before = rows[old] + down[old - col + N - 1] + up[old + col] - 3
+        after = rows[new] + down[new - col + N - 1] + up[new + col]
+        return before - after
+
+    def goal_test(self, state):
+        return self.value(state) == 0
+
+
 # ______________________________________________________________________________
 # Inverse Boggle: Search for a high-scoring Boggle board. A good domain for
 # iterative-repair and related search techniques, as suggested by Justin Boyan.
@@ -2081,10 +3428,64 @@ def exact_sqrt(n2):
 # _____________________________________________________________________________
 
 
+def build_dawg(words):
+    """Build a DAWG (a trie whose equal subtrees are merged into one) of the
+    sorted words, by Daciuk's incremental algorithm, and return it as two
+    flat arrays: children[26 * node + k] is the node reached from node by
+    the k-th letter of ALPHABET, or 0 if there is none (0 is the root, which
+    is nobody's child), and final[node] is 1 iff the path to node spells one
+    of the words. Words with other characters than ALPHABET are left out."""
+    edges, final = [{}], [False]
+    register = {}
+    unchecked = []  # (parent, letter, child) along the path of the last word
+
+    def minimize(depth):
+        while len(unchecked) > depth:
+            parent, letter, child = unchecked.pop()
+            key = (final[child], tuple(edges[child].items()))
+            if key in register:
+                edges[parent][letter] = register[key]
+            else:
+                register[key] = child
+
+    previous = ''
+    for word in words:
+        if word == previous or not (word.isascii() and word.isalpha() and word.isupper()):
+            continue
+        common = len(os.path.commonprefix([previous, word]))
+        minimize(common)
+        node = unchecked[-1][2] if unchecked else 0
+        for letter in word[common:]:
+            edges.append({})
+            final.append(False)
+            edges[node][letter] = len(edges) - 1
+            unchecked.append((node, letter, len(edges) - 1))
+            node = len(edges) - 1
+        final[node] = True
+        previous = word
+    minimize(0)
+    # Number the nodes that are left breadth-first, and lay them out flat.
+    number = {0: 0}
+    order = [0]
+    for node in order:
+        for child in edges[node].values():
+            if child not in number:
+                number[child] = len(order)
+                order.append(child)
+    children = array.array('i', bytes(4 * 26 * len(order)))
+    for node in order:
+        base = 26 * number[node]
+        for letter, child in edges[node].items():
+            children[base + ord(letter) - 65] = number[child]
+    return children, bytes(final[node] for node in order)
+
+
 class Wordlist:
     """This class holds a list of words. You can use (word in wordlist)
     to check if a word is in the list, or wordlist.lookup(prefix)
-    to see if prefix starts any of the words in the list."""
+    to see if prefix starts any of the words in the list. The words are
+    also held in a DAWG (see build_dawg), which BoggleFinder walks a letter
+    at a time with wordlist.child(node, letters)."""
 
     def __init__(self, file, min_len=3):
         lines = file.read().upper().split()
@@ -2095,6 +3496,17 @@ class Wordlist:
             c2 = chr(ord(c) + 1)
             self.bounds[c] = (bisect.bisect(self.words, c),
                               bisect.bisect(self.words, c2))
+        self.children, self.final = build_dawg(self.words)
+
+    def child(self, node, letters):
+        """The DAWG node reached from node by the upper-case letters, or 0 if
+        no word continues that way."""
+        children = self.children
+        for c in letters:
+            node = children[26 * node + ord(c) - 65]
+            if not node:
+                return 0
+        return node
 
     def lookup(self, prefix, lo=0, hi=None):
         """See if prefix is in dictionary, as a full word or as a prefix.
@@ -2139,29 +3551,42 @@ class BoggleFinder:
         self.board = board
         self.neighbors = boggle_neighbors(len(board))
         self.found = {}
-        for i in range(len(board)):
-            lo, hi = self.wordlist.bounds[board[i]]
-            self.find(lo, hi, i, [], '')
+        self.letters = ['QU' if c == 'Q' else c for c in board]
+        self.find()
         return self
 
-    def find(self, lo, hi, i, visited, prefix):
-        """Looking in square i, find the words that continue the prefix,
-        considering the entries in self.wordlist.words[lo:hi], and not
-        revisiting the squares in visited."""
-        if i in visited:
-            return
-        wordpos, is_word = self.wordlist.lookup(prefix, lo, hi)
-        if wordpos is not None:
-            if is_word:
-                self.found[prefix] = True
-            visited.append(i)
-            c = self.board[i]
-            if c == 'Q':
-                c = 'QU'
-            prefix += c
-            for j in self.neighbors[i]:
-                self.find(wordpos, hi, j, visited, prefix)
-            visited.pop()
+    def find(self):
+        """Find the words on the board by a depth-first search with an
+        explicit stack of (DAWG node, square, visited, prefix) entries, where
+        the prefix ends in the square, leads to the node, and has visited the
+        squares whose bits are set in visited. A prefix counts as found if it
+        is a word and there is a square it could go on to. Children are
+        pushed in reverse, so the words are found in the order of a recursive
+        search."""
+        wordlist, letters, neighbors, found = self.wordlist, self.letters, self.neighbors, self.found
+        children, final = wordlist.children, wordlist.final
+        codes = [ord(c) - 65 for c in self.board]
+        stack = []
+        for i in reversed(range(len(letters))):
+            node = wordlist.child(0, letters[i])
+            if node:
+                stack.append((node, i, 1 << i, letters[i]))
+        while stack:
+            node, i, visited, prefix = stack.pop()
+            is_word, base = final[node], 26 * node
+            pushed = []
+            for j in neighbors[i]:
+                if visited >> j & 1:
+                    continue
+                if is_word:
+                    found[prefix] = True
+                child = children[base + codes[j]]
+                if child and letters[j] == 'QU':
+                    child = wordlist.child(child, 'U')
+                if child:
+                    pushed.append((child, j, visited | 1 << j, prefix + letters[j]))
+            pushed.reverse()
+            stack += pushed
 
     def words(self):
         """The words found."""
@@ -2210,18 +3635,116 @@ def mutate_boggle(board):
     return i, oldc
 
 
+class BoggleProblem(Problem):
+    """Inverse Boggle as a local search problem: a state is a board, as a
+    tuple of letters, and an action (i, c) puts letter c in square i. The
+    value of a board is the number of words in it. Finding the words is the
+    costly part, so values go through the value cache: a neighbor costs one
+    BoggleFinder run, and the current board none."""
+
+    def __init__(self, board=None):
+        super().__init__(tuple(board or random_boggle()))
+        self.finder = BoggleFinder()
+
+    def actions(self, state):
+        return [(i, c) for i in range(len(state)) for c in ALPHABET if c != state[i]]
+
+    def random_action(self, state):
+        i = random.randrange(len(state))
+        return i, random.choice(ALPHABET.replace(state[i], ''))
+
+    def result(self, state, action):
+        i, c = action
+        return state[:i] + (c,) + state[i + 1:]
+
+    def value(self, state):
+        return len(self.finder.set_board(list(state)))
+
+
+def boggle_fitness(board):
+    """The number of words in board: a fitness_fn for the genetic algorithms,
+    with individuals made by init_population(n, list(ALPHABET), 16)."""
+    return len(BoggleFinder(list(board)))
+
+
 # ______________________________________________________________________________
 
 # Code to compare searchers on various problems.
 
 
-class InstrumentedProblem(Problem):
-    """Delegates to a problem, and keeps statistics."""
+class SearchStats:
+    """The statistics kept by InstrumentedProblem and by instrument(). Besides
+    the succs, goal_tests and states counters (a delta_value call counts as
+    one state, the neighbor it looks at, however it is computed) they track the current and
+    peak frontier and explored set sizes (through the searcher hooks of
+    Problem), the number of h calls and the time spent in them, and, when
+    the searcher is started with .run, the wall time and optionally the
+    tracemalloc peak."""
 
-    def __init__(self, problem):
-        self.problem = problem
+    counters = ('succs', 'goal_tests', 'states', 'found', 'error', 'wall_time',
+                'max_frontier', 'max_explored', 'h_calls', 'h_time', 'peak_memory')
+
+    def reset_stats(self):
         self.succs = self.goal_tests = self.states = 0
         self.found = None
+        self.error = None
+        self.wall_time = self.h_time = 0.0
+        self.frontier = self.max_frontier = 0
+        self.explored = self.max_explored = 0
+        self.h_calls = 0
+        self.peak_memory = None
+
+    def run(self, searcher, trace_memory=False):
+        """Return searcher(self), recording its wall time and, if trace_memory,
+        the peak of memory allocated meanwhile according to tracemalloc (which
+        itself makes the search several times slower)."""
+        tracing = trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        elif trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            return searcher(self)
+        finally:
+            self.wall_time = time.perf_counter() - start
+            if trace_memory:
+                self.peak_memory = tracemalloc.get_traced_memory()[1]
+            if tracing:
+                tracemalloc.stop()
+
+    def stats(self):
+        """Return a dict of the counters, plus the derived nodes_per_second."""
+        stats = {attr: getattr(self, attr) for attr in self.counters}
+        stats['nodes_per_second'] = self.succs / self.wall_time if self.wall_time else None
+        return stats
+
+    def frontier_push(self, node):
+        self.frontier += 1
+        if self.frontier > self.max_frontier:
+            self.max_frontier = self.frontier
+
+    def frontier_pop(self, node):
+        self.frontier -= 1
+
+    def explored_add(self, state):
+        self.explored += 1
+        if self.explored > self.max_explored:
+            self.max_explored = self.explored
+
+    def __repr__(self):
+        return '<{:4d}/{:4d}/{:4d}/{}>'.format(self.succs, self.goal_tests,
+                                               self.states, self.error or str(self.found)[:4])
+
+
+class InstrumentedProblem(SearchStats, Problem):
+    """Delegates to a problem, and keeps statistics (see SearchStats).
+    Any other attribute is looked up on the problem through __getattr__;
+    instrument() avoids that cost."""
+
+    def __init__(self, problem):
+        self.problem = problem
+        self.reset_stats()
 
     def actions(self, state):
         self.succs += 1
@@ -2244,12 +3767,150 @@ class InstrumentedProblem(Problem):
     def value(self, state):
         return self.problem.value(state)
 
+    def delta_value(self, state, action):
+        self.states += 1
+        return self.problem.delta_value(state, action)
+
+    def cached_value(self, state):
+        return self.problem.cached_value(state)
+
+    def random_action(self, state):
+        return self.problem.random_action(state)
+
+    def h(self, node):
+        self.h_calls += 1
+        start = time.perf_counter()
+        try:
+            return self.problem.h(node)
+        finally:
+            self.h_time += time.perf_counter() - start
+
     def __getattr__(self, attr):
         return getattr(self.problem, attr)
 
-    def __repr__(self):
-        return '<{:4d}/{:4d}/{:4d}/{}>'.format(self.succs, self.goal_tests,
-                                               self.states, str(self.found)[:4])
+
+def instrument(problem):
+    """Return an instrumented copy of problem that keeps the same statistics as
+    InstrumentedProblem(problem) at a fraction of the cost. The copy is an
+    instance of a subclass of the problem's own class (see instrumented_class)
+    sharing the problem's attributes, so e.g. self.goal or find_blank_square
+    are found directly, without going through __getattr__."""
+    p = object.__new__(instrumented_class(type(problem)))
+    # setattr rather than __dict__.update keeps CPython's compact instance
+    # attributes, which makes every self.x in the problem's methods cheaper.
+    p.reset_stats()
+    for attr, value in vars(problem).items():
+        setattr(p, attr, value)
+    return p
+
+
+@functools.lru_cache(maxsize=None)
+def instrumented_class(cls):
+    """Return a subclass of the problem class cls whose actions, result,
+    goal_test, delta_value and h count their calls before calling the
+    methods of cls, which are bound once here rather than looked up with
+    super() each call."""
+    base_actions, base_result, base_goal_test = cls.actions, cls.result, cls.goal_test
+    base_delta_value = cls.delta_value
+    base_h = getattr(cls, 'h', None)
+
+    def actions(self, state):
+        self.succs += 1
+        return base_actions(self, state)
+
+    def result(self, state, action):
+        self.states += 1
+        return base_result(self, state, action)
+
+    def goal_test(self, state):
+        self.goal_tests += 1
+        result = base_goal_test(self, state)
+        if result:
+            self.found = state
+        return result
+
+    def delta_value(self, state, action):
+        self.states += 1
+        if base_delta_value is Problem.delta_value:
+            # The default builds the neighbor; it is already counted.
+            return self.cached_value(base_result(self, state, action)) - self.cached_value(state)
+        return base_delta_value(self, state, action)
+
+    def h(self, node):
+        self.h_calls += 1
+        start = time.perf_counter()
+        try:
+            return base_h(self, node)
+        finally:
+            self.h_time += time.perf_counter() - start
+
+    def __reduce__(self):
+        return restore_instrumented, (cls, self.__dict__)
+
+    methods = dict(actions=actions, result=result, goal_test=goal_test, delta_value=delta_value,
+                   __reduce__=__reduce__, __module__=cls.__module__,
+                   __qualname__='Instrumented' + cls.__qualname__)
+    if base_h is not None:
+        methods['h'] = h
+    return type('Instrumented' + cls.__name__, (SearchStats, cls), methods)
+
+
+def restore_instrumented(cls, state):
+    """Unpickle an instance of instrumented_class(cls)."""
+    p = object.__new__(instrumented_class(cls))
+    for attr, value in state.items():
+        setattr(p, attr, value)
+    return p
+
+
+class SearchTimeout(Exception):
+    """Raised inside a searcher when the time limit of search_limits runs out."""
+
+
+@contextlib.contextmanager
+def search_limits(timeout=None, memory_limit=None):
+    """Within this block, raise SearchTimeout after timeout seconds and
+    MemoryError once the process address space would grow past memory_limit
+    bytes. Both rely on Unix signals and resource limits, and are silently
+    ignored where those are missing (e.g. on Windows). Only use this in the
+    main thread of a process you own, such as a process pool worker."""
+    timer = timeout and hasattr(signal, 'setitimer')
+    capped = memory_limit and resource is not None
+    if timer:
+        def on_alarm(signum, frame):
+            raise SearchTimeout
+        old_handler = signal.signal(signal.SIGALRM, on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    if capped:
+        old_limits = resource.getrlimit(resource.RLIMIT_AS)
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, old_limits[1]))
+    try:
+        yield
+    finally:
+        if timer:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, old_handler)
+        if capped:
+            resource.setrlimit(resource.RLIMIT_AS, old_limits)
+
+
+def run_instrumented(searcher, problem, timeout=None, memory_limit=None, trace_memory=False,
+                     wrap=InstrumentedProblem):
+    """Run searcher on wrap(problem), within search_limits(timeout,
+    memory_limit), and return its .stats(). The error entry is None or names
+    what stopped the searcher. This is the task compare_searchers sends to
+    its process pool, so searcher and problem must be picklable."""
+    p = wrap(problem)
+    try:
+        with search_limits(timeout, memory_limit):
+            p.run(searcher, trace_memory)
+    except SearchTimeout:
+        p.error = 'timeout'
+    except MemoryError:
+        p.error = 'memory'
+    except Exception as e:
+        p.error = type(e).__name__
+    return p.stats()
 
 
 def compare_searchers(problems, header,
@@ -2258,18 +3919,91 @@ def compare_searchers(problems, header,
                                  depth_first_graph_search,
                                  iterative_deepening_search,
                                  depth_limited_search,
-                                 recursive_best_first_search]):
+                                 recursive_best_first_search],
+                      parallel=False, timeout=None, memory_limit=None, max_workers=None,
+                      details=False, trace_memory=False, wrap=InstrumentedProblem):
+    """Print a table with the InstrumentedProblem counters of every searcher
+    on every problem, and return the InstrumentedProblems as a list of rows.
+    With parallel=True the (searcher, problem) cells run in a process pool of
+    max_workers processes, and a cell that runs longer than timeout seconds or
+    needs more than memory_limit bytes is stopped and shown as 'timeout' or
+    'memory' instead of holding up the whole table. With details=True a
+    second table lists time, node rate, peak frontier and explored sizes,
+    h calls and (with trace_memory) peak memory for every cell. Pass
+    wrap=instrument for cheaper instrumentation and more faithful timings."""
     def do(searcher, problem):
-        p = InstrumentedProblem(problem)
-        searcher(p)
+        p = wrap(problem)
+        p.run(searcher, trace_memory)
         return p
 
-    table = [[name(s)] + [do(s, p) for p in problems] for s in searchers]
+    if not parallel:
+        table = [[name(s)] + [do(s, p) for p in problems] for s in searchers]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [[executor.submit(run_instrumented, s, p, timeout, memory_limit, trace_memory, wrap)
+                        for p in problems]
+                       for s in searchers]
+            table = []
+            for s, row in zip(searchers, futures):
+                cells = []
+                for p, future in zip(problems, row):
+                    cell = wrap(p)
+                    try:
+                        stats = future.result()
+                        for attr in InstrumentedProblem.counters:
+                            setattr(cell, attr, stats[attr])
+                    except Exception as e:  # e.g. the worker process died
+                        cell.error = type(e).__name__
+                    cells.append(cell)
+                table.append([name(s)] + cells)
+    rows = [row[1:] for row in table]
     print_table(table, header)
+    if details:
+        print()
+        print_stats(stats_records(rows, [name(s) for s in searchers], header[1:]))
+    return rows
+
+
+def stats_records(rows, searcher_names, problem_names):
+    """Flatten the rows returned by compare_searchers into a list of dicts,
+    one per cell, with the searcher and problem names and the cell's stats."""
+    records = []
+    for searcher_name, row in zip(searcher_names, rows):
+        for problem_name, p in zip(problem_names, row):
+            record = {'searcher': searcher_name, 'problem': problem_name}
+            record.update(p.stats())
+            records.append(record)
+    return records
+
+
+def print_stats(records):
+    """Print stats records as a table, one line per searcher and problem."""
+    columns = ['searcher', 'problem', 'succs', 'goal_tests', 'states', 'wall_time', 'nodes_per_second',
+               'max_frontier', 'max_explored', 'h_calls', 'h_time', 'peak_memory', 'error']
+
+    def fmt(x):
+        if x is None:
+            return '-'
+        return '{:.4g}'.format(x) if isinstance(x, float) else x
+
+    print_table([[fmt(record[c]) for c in columns] for record in records], columns)
+
+
+def export_stats(records, filename):
+    """Write stats records to filename, as CSV or JSON depending on its extension."""
+    with open(filename, 'w', newline='') as f:
+        if filename.endswith('.json'):
+            json.dump(records, f, indent=2, default=str)
+        else:
+            writer = csv.DictWriter(f, fieldnames=list(records[0]))
+            writer.writeheader()
+            for record in records:
+                writer.writerow({k: (v if isnumber(v) or v is None else str(v)) for k, v in record.items()})
 
 
 def compare_graph_searchers():
     """Prints a table of search results."""
+    romania_map = country_maps.graph('Romania')
     compare_searchers(problems=[GraphProblem('Arad', 'Bucharest', romania_map),
                                 GraphProblem('Oradea', 'Neamt', romania_map),
                                 GraphProblem('Q', 'WA', australia_map)],